@@ -1,6 +1,27 @@
 import streamlit as st
 import pandas as pd
 import io
+import os
+import uuid
+import db_source
+import instrumentation
+import report_sql
+from dataset_registry import DatasetRegistry
+from report_export import export_formats, write_export
+from report_cube import build_cube, cube_summary, previous_period
+from report_checks import check_exports, findings_summary
+from report_customers import CustomerIndex
+from report_jobs import BuildJobs, ExportWatcher, watch_dir
+from report_items import items_key, load_line_items, product_breakdowns, product_summary
+from order_table import OrderIndex, filter_columns, sortable_columns, page_sizes
+from report_pipeline import (
+    meta_keys, ingest_schema, pivot_meta, build_report, load_report, upsert_orders,
+    report_windows, compute_stats, status_counts, cashier_performance, monthly_sales, store_performance
+)
+from report_store import (
+    dataset_key, frame_key, cached_dataset_path, load_cached_dataset, store_cached_dataset, load_base_dataset, store_base_dataset, upsert_base_dataset, stored_base_version,
+    stored_base_summary, stored_months, load_db_watermark, store_db_watermark
+)
 
 st.set_page_config(page_title="WooCommerce & POS Report Fabricator", layout='wide')
 
@@ -9,6 +30,20 @@ st.image("logo.png")
 st.header("Welcome to Vitamin Point of Sale Report Fabricator")
 st.text("This tool allows you to fabricate a thorough report for WooCommerce, YITH POS, Multi-Inventory, Customer Data & COGS System.")
 st.subheader("", divider="rainbow")
+# Summaries and charts run on pandas, or on DuckDB over the report's Parquet file when it is installed
+analytics_backend = os.environ.get("REPORT_ANALYTICS_BACKEND", "pandas")
+if analytics_backend == "duckdb" and not report_sql.available():
+    st.sidebar.warning("REPORT_ANALYTICS_BACKEND=duckdb needs the duckdb package (pip install duckdb); using pandas.")
+    analytics_backend = "pandas"
+
+# Diagnostics toggle; stage records are shown in the sidebar at the end of the run
+with st.sidebar:
+    collect_diagnostics = st.toggle("Collect stage diagnostics", value=os.environ.get("REPORT_DIAGNOSTICS") == "1")
+if collect_diagnostics:
+    stage_records = instrumentation.start_recording()
+else:
+    instrumentation.stop_recording()
+
 # Helpbox
 with st.expander("Helpbox", expanded=False):
     st.write("Export the following tables from your database:")
@@ -17,6 +52,11 @@ with st.expander("Helpbox", expanded=False):
     - [wp_wc_orders_meta](https://vitaminphones.com/phpmyadmin/index.php?route=/table/export&db=vitaminphones_wp&table=wp_wc_orders_meta&single_table=true)
     - [wp_wc_order_addresses](https://vitaminphones.com/phpmyadmin/index.php?route=/table/export&db=vitaminphones_wp&table=wp_wc_order_addresses&single_table=true)
     """)
+    st.write("For product analytics, also export:")
+    st.markdown("""
+    - [wp_woocommerce_order_items](https://vitaminphones.com/phpmyadmin/index.php?route=/table/export&db=vitaminphones_wp&table=wp_woocommerce_order_items&single_table=true)
+    - [wp_woocommerce_order_itemmeta](https://vitaminphones.com/phpmyadmin/index.php?route=/table/export&db=vitaminphones_wp&table=wp_woocommerce_order_itemmeta&single_table=true)
+    """)
 
 # Raw Data Upload Section
 st.subheader("Raw Data Upload Section")
@@ -36,313 +76,615 @@ with button_col3:
     st.write("**wp_wc_order_addresses.csv**")
     orders_addr_file = st.file_uploader("Upload Order Addresses Data (wp_wc_order_addresses)", type='csv')
 
+# Optional line item tables for product analytics
+st.write("Optionally upload the order item tables to break sales, cost and profit down by product.")
+item_col1, item_col2 = st.columns(2)
+
+with item_col1:
+    st.write("**wp_woocommerce_order_items.csv**")
+    items_file = st.file_uploader("Upload Order Items (wp_woocommerce_order_items)", type='csv')
+
+with item_col2:
+    st.write("**wp_woocommerce_order_itemmeta.csv**")
+    itemmeta_file = st.file_uploader("Upload Order Item Meta (wp_woocommerce_order_itemmeta)", type='csv')
+
+# Previews only parse the first rows; the full files are parsed in parallel when the report is built
+preview_max_rows = 50
+
 @st.cache_data
-def load_csv(file):
-    return pd.read_csv(file)
+def load_preview(file):
+    file.seek(0)
+    return pd.read_csv(file, nrows=preview_max_rows)
 
 df_orders = pd.DataFrame()
 df_meta = pd.DataFrame()
 df_address = pd.DataFrame()
 
 if orders_file is not None:
-    df_orders = load_csv(orders_file)
+    df_orders = load_preview(orders_file)
 if orders_meta_file is not None:
-    df_meta = load_csv(orders_meta_file)
+    df_meta = load_preview(orders_meta_file)
 if orders_addr_file is not None:
-    df_address = load_csv(orders_addr_file)
-
-# Add a slider to control preview rows
-preview_rows = st.slider("Number of rows to preview:", min_value=5, max_value=50, value=20)
-
-st.subheader("Integrity Checks & Data Preview")
-st.divider()
-
-if not df_orders.empty and not df_meta.empty and not df_address.empty:
-    preview_tabs = st.tabs(["Orders Preview", "Meta Preview", "Addresses Preview"])
-    with preview_tabs[0]:
-        st.write(df_orders.head(preview_rows))
-    with preview_tabs[1]:
-        st.write(df_meta.head(preview_rows))
-    with preview_tabs[2]:
-        st.write(df_address.head(preview_rows))
-else:
-    st.warning("Please upload all three datasets for a full preview.")
-
-def preprocess_orders(df):
-    if 'date_created_gmt' in df.columns:
-        df['date_created_gmt'] = pd.to_datetime(df['date_created_gmt'], errors='coerce')
-    # Convert numeric columns
-    numeric_cols = ['tax_amount', 'total_amount']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+    df_address = load_preview(orders_addr_file)
+
+@st.cache_data(max_entries=4, show_spinner="Checking the exports...")
+def export_checks(file_ids, _files):
+    # Keyed on the upload ids, so each upload is checked once rather than on every rerun
+    return check_exports(*_files)
+
+def render_checks(files):
+    try:
+        findings = export_checks(tuple(f.file_id for f in files), files)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    failed = [f for f in findings if f['rows']]
+    if any(f['severity'] == 'error' for f in failed):
+        st.error("Some checks found problems that fail the build or double count orders.")
+    elif failed:
+        st.warning("Some checks found rows that will be blank or resolved automatically in the report.")
+    else:
+        st.success("All integrity checks passed.")
+    st.dataframe(findings_summary(findings), hide_index=True)
+    for f in failed:
+        with st.expander(f"{f['check']} in {f['table']}: {f['rows']} rows"):
+            st.dataframe(f['sample'], hide_index=True)
+
+# Previews run in a fragment so moving the slider only reruns this section
+@st.fragment
+def render_previews(df_orders, df_meta, df_address, files):
+    # Add a slider to control preview rows
+    preview_rows = st.slider("Number of rows to preview:", min_value=5, max_value=preview_max_rows, value=20)
+
+    st.subheader("Integrity Checks & Data Preview")
+    st.divider()
+
+    if not df_orders.empty and not df_meta.empty and not df_address.empty:
+        render_checks(files)
+        preview_tabs = st.tabs(["Orders Preview", "Meta Preview", "Addresses Preview"])
+        with preview_tabs[0]:
+            st.write(df_orders.head(preview_rows))
+        with preview_tabs[1]:
+            st.write(df_meta.head(preview_rows))
+        with preview_tabs[2]:
+            st.write(df_address.head(preview_rows))
+    else:
+        st.warning("Please upload all three datasets for a full preview.")
+
+render_previews(df_orders, df_meta, df_address, [orders_file, orders_meta_file, orders_addr_file])
+
+@st.cache_resource
+def dataset_registry():
+    return DatasetRegistry()
+
+# Reports are held once per server process; each session only keeps the content key of its report
+registry = dataset_registry()
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+def hold_dataset(state_key, df, version):
+    previous = st.session_state.get(state_key)
+    if previous is not None and previous != version:
+        registry.release(previous, session_id)
+    registry.put(version, df, session_id)
+    st.session_state[state_key] = version
+
+def held_dataset(state_key):
+    version = st.session_state.get(state_key)
+    if version is None:
+        return None
+    df = registry.get(version, session_id)
+    if df is None:
+        # Evicted after this session went idle; generated reports come back from the on-disk cache
+        df = load_cached_dataset(version)
+        if df is None:
+            del st.session_state[state_key]
+            return None
+        df = registry.put(version, df, session_id)
+    return df
+
+def set_report(df, version):
+    # The content key doubles as the dataset version that keys the memoized aggregates
+    hold_dataset("dataset_version", df, version)
+
+def current_report():
+    return held_dataset("dataset_version")
+
+def set_line_items(df, key, report_version):
+    # Line items are held like reports, and belong to the report they were joined to
+    hold_dataset("line_items_version", df, key)
+    st.session_state["line_items_report"] = report_version
+
+def current_line_items(report_version):
+    if st.session_state.get("line_items_report") != report_version:
+        return None
+    return held_dataset("line_items_version")
+
+@st.cache_data(max_entries=8, ttl=900)
+def report_aggregates(version, _df, backend="pandas"):
+    # Keyed on the dataset version only; the ttl keeps the rolling windows from going stale
+    if backend == "duckdb":
+        # The SQL engine scans the report's Parquet copy in the report cache, written here if it is missing
+        path = cached_dataset_path(version)
+        if not os.path.exists(path):
+            store_cached_dataset(version, _df)
+        return report_sql.report_aggregates(path, report_windows())
+    return {
+        'time_periods': compute_stats(_df, report_windows()),
+        'status_counts': status_counts(_df) if 'Order Status' in _df.columns else None,
+        'cashier_performance': cashier_performance(_df) if "Cashier Name" in _df.columns else None,
+        'monthly_sales': monthly_sales(_df) if 'Order Date' in _df.columns else None,
+        'store_performance': store_performance(_df) if 'POS Store' in _df.columns else None
+    }
+
+@st.cache_resource
+def get_db_pool(engine, path="", host="", port=3306, user="", password="", database=""):
+    if engine == "SQLite":
+        return db_source.sqlite_pool(path)
+    return db_source.mysql_pool(host, user, password, database, port=port)
+
+def build_with_progress(orders, meta, addresses):
+    # The three tables are parsed concurrently; each line appears as its branch finishes
+    with st.status("Parsing orders, meta and addresses...", expanded=True) as status:
+        def branch_done(name, df, seconds):
+            status.write(f"**{name}** ready: {len(df)} rows in {seconds:.2f}s")
+        result = load_report(orders, meta, addresses, on_branch_done=branch_done)
+        status.update(label="Report built", state="complete", expanded=False)
+    return result
+
+@st.cache_resource
+def build_jobs():
+    return BuildJobs()
+
+# Full builds run on a background worker owned by the server, so the page stays responsive and a build
+# keeps going when the browser disconnects
+jobs = build_jobs()
+
+def run_report_build(job, key, files):
+    # Runs on the worker; the report is cached and its shared indexes are built before any session attaches
+    merged_df, _ = load_report(*files)
+    job.enter('aggregate')
+    registry.put(key, merged_df)
+    registry.derived(key, 'cube', lambda: build_cube(merged_df))
+    job.check()
+    registry.derived(key, 'order_index', lambda: OrderIndex(merged_df))
+    job.check()
+    store_cached_dataset(key, merged_df)
+
+def submit_build(key, files, label, diagnostics):
+    return jobs.submit(key, label, lambda job: run_report_build(job, key, files), diagnostics)
+
+def attach_report(key):
+    df = registry.get(key)
+    if df is None:
+        df = load_cached_dataset(key)
+    if df is not None:
+        set_report(df, key)
     return df
 
-def preprocess_meta(df):
-    # Pivot meta data
-    df_pivot = df.pivot(index='order_id', columns='meta_key', values='meta_value').reset_index()
-    # Attempt numeric conversion on meta_values
-    for c in df_pivot.columns:
-        if c not in ['order_id']:
-            df_pivot[c] = pd.to_numeric(df_pivot[c], errors='ignore')
-    return df_pivot
-
-def preprocess_address(df):
-    # Pivot address by address_type
-    df_pivot = df.pivot(index='order_id', columns='address_type')
-    df_pivot.columns = ['_'.join(col).strip() for col in df_pivot.columns.values]
-    df_pivot = df_pivot.reset_index()
-    return df_pivot
-
-# Check if we already have a merged_df in session state
-if 'merged_df' not in st.session_state:
+def watched_exports(paths):
+    handles = [open(path, "rb") for path in paths]
+    try:
+        key = dataset_key(handles)
+    finally:
+        for handle in handles:
+            handle.close()
+    if registry.get(key) is None and not os.path.exists(cached_dataset_path(key)):
+        # No session starts these builds, so only REPORT_DIAGNOSTICS turns their diagnostics on
+        submit_build(key, paths, f"Exports in {watch_dir}", os.environ.get("REPORT_DIAGNOSTICS") == "1")
+
+@st.cache_resource
+def export_watcher(directory):
+    return ExportWatcher(directory, watched_exports)
+
+# New exports dropped into REPORT_WATCH_DIR are built without anyone pressing a button
+watcher = export_watcher(watch_dir) if watch_dir else None
+
+# Polls this session's build and attaches to the report once it is ready
+@st.fragment(run_every=1.0)
+def render_build_status():
+    key = st.session_state.get("build_job")
+    job = jobs.get(key) if key else None
+    if job is None:
+        st.session_state.pop("build_job", None)
+        return
+    if job.active:
+        st.progress(job.progress, text=f"Building report: {job.phase or 'queued'}...")
+        if st.button("Cancel build"):
+            job.cancel()
+        return
+    del st.session_state["build_job"]
+    st.session_state["last_build"] = key
+    if job.state == 'done' and attach_report(key) is None:
+        st.session_state["build_notice"] = ('error', "The built report is no longer available; generate it again.")
+    elif job.state == 'failed':
+        st.session_state["build_notice"] = ('error', job.error)
+    elif job.state == 'cancelled':
+        st.session_state["build_notice"] = ('info', "Report build cancelled.")
+    st.rerun()
+
+# Check if this session already has a report
+if current_report() is None:
+    notice = st.session_state.pop("build_notice", None)
+    if notice is not None:
+        getattr(st, notice[0])(notice[1])
+    if "build_job" in st.session_state:
+        render_build_status()
     # Only show "Generate Report" button if all files are available
-    if (orders_file is not None) and (orders_meta_file is not None) and (orders_addr_file is not None):
+    elif (orders_file is not None) and (orders_meta_file is not None) and (orders_addr_file is not None):
         if st.button("Generate Report"):
-            df_orders_clean = preprocess_orders(df_orders)
-            df_meta_clean = preprocess_meta(df_meta)
-            df_address_clean = preprocess_address(df_address)
-
-            main_cols = [
-                "id","status","currency","type","tax_amount","total_amount","customer_id",
-                "billing_email","date_created_gmt","payment_method","payment_method_title",
-                "transaction_id","customer_note"
-            ]
-            missing_cols = [c for c in main_cols if c not in df_orders_clean.columns]
-            if missing_cols:
-                st.error(f"The following required columns are missing from wp_wc_orders: {missing_cols}")
+            report_key = dataset_key([orders_file, orders_meta_file, orders_addr_file])
+            if attach_report(report_key) is None:
+                # The worker reads its own copies, so reruns of this script can keep reading the uploads
+                files = [io.BytesIO(f.getvalue()) for f in (orders_file, orders_meta_file, orders_addr_file)]
+                submit_build(report_key, files, "Uploaded exports", collect_diagnostics)
+                st.session_state["build_job"] = report_key
+                render_build_status()
+
+def current_base():
+    # The session's report, or else the stored base dataset, with the version each was saved under
+    df = current_report()
+    if df is not None:
+        return df, st.session_state["dataset_version"]
+    return load_base_dataset(), stored_base_version()
+
+def base_overview():
+    # What the update section shows about the base; the stored base is described from its manifest, since
+    # this runs on every rerun and loading the full history just to count it is far too slow
+    df = current_report()
+    if df is not None:
+        return {'orders': len(df), 'last_order_id': df['Order ID'].max(), 'latest_order': df['Order Date'].max()}
+    return stored_base_summary()
+
+def save_base(updated_df, delta_df, base_version):
+    # When the stored base is the dataset that was updated, only the months the delta touches are rewritten.
+    # A single-file base from earlier versions is rewritten whole, into partitions
+    version = frame_key(updated_df)
+    if base_version is not None and base_version == stored_base_version() and stored_months():
+        upsert_base_dataset(delta_df, version)
+    else:
+        store_base_dataset(updated_df, version)
+    # Cached like an uploaded build, so the session's report reloads after the registry drops it
+    store_cached_dataset(version, updated_df)
+    return version
+
+# Incremental Update Section
+with st.expander("Incremental Update", expanded=False):
+    st.write("Upload delta exports (orders with an id above the last Order ID, or modified since the last update) to merge them into the current report.")
+    base_info = base_overview()
+    if base_info is None:
+        st.info("No base dataset yet. Generate a full report first.")
+    else:
+        st.write(f"**Base dataset:** {base_info['orders']} orders, last Order ID {base_info['last_order_id']}, latest order {base_info['latest_order']}")
+
+    delta_col1, delta_col2, delta_col3 = st.columns(3)
+    with delta_col1:
+        delta_orders_file = st.file_uploader("Upload Order Main Delta (wp_wc_orders)", type='csv', key="delta_orders")
+    with delta_col2:
+        delta_meta_file = st.file_uploader("Upload Order Meta Delta (wp_wc_orders_meta)", type='csv', key="delta_meta")
+    with delta_col3:
+        delta_addr_file = st.file_uploader("Upload Order Addresses Delta (wp_wc_order_addresses)", type='csv', key="delta_addr")
+
+    if base_info is not None and (delta_orders_file is not None) and (delta_meta_file is not None) and (delta_addr_file is not None):
+        if st.button("Apply Update"):
+            base_df, base_version = current_base()
+            try:
+                delta_df, _ = build_with_progress(delta_orders_file, delta_meta_file, delta_addr_file)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                updated_df = upsert_orders(base_df, delta_df)
+                set_report(updated_df, save_base(updated_df, delta_df, base_version))
+                st.success(f"Merged {len(delta_df)} changed orders; the report now holds {len(updated_df)} orders.")
+
+# Database Source Section
+with st.expander("Database Source", expanded=False):
+    st.write("Pull the three tables straight from the database instead of exporting CSVs. Repeat pulls only fetch orders created or modified since the last pull.")
+    db_engine = st.radio("Database", ["MySQL", "SQLite"], horizontal=True)
+    if db_engine == "SQLite":
+        db_params = {'path': st.text_input("SQLite file", value=os.environ.get("REPORT_SQLITE_PATH", ""))}
+    else:
+        db_col1, db_col2 = st.columns(2)
+        with db_col1:
+            db_host = st.text_input("Host", value=os.environ.get("REPORT_DB_HOST", "localhost"))
+            db_port = st.number_input("Port", min_value=1, max_value=65535, value=int(os.environ.get("REPORT_DB_PORT", "3306")))
+            db_name = st.text_input("Database name", value=os.environ.get("REPORT_DB_NAME", ""))
+        with db_col2:
+            db_user = st.text_input("User", value=os.environ.get("REPORT_DB_USER", ""))
+            db_password = st.text_input("Password", value=os.environ.get("REPORT_DB_PASSWORD", ""), type="password")
+        db_params = {'host': db_host, 'port': int(db_port), 'user': db_user, 'password': db_password, 'database': db_name}
+    db_prefix = st.text_input("Table prefix", value="wp_")
+    db_batch_size = st.number_input("Fetch batch size", min_value=1000, value=50_000, step=1000)
+    db_full_pull = st.checkbox("Full pull (ignore the saved watermark)")
+
+    db_watermark = load_db_watermark()
+    if db_watermark:
+        st.write(f"**Last pull:** Order ID {db_watermark['id']}, updated {db_watermark['date_updated_gmt']}")
+
+    if st.button("Pull from Database"):
+        base_df, base_version = current_base()
+        # Without a base dataset to merge into, a watermarked pull would miss older orders
+        watermark = None if db_full_pull or base_df is None else db_watermark
+        try:
+            pool = get_db_pool(db_engine, **db_params)
+            pulled_orders, pulled_meta, pulled_address, new_watermark = db_source.pull_tables(
+                pool, meta_keys, watermark=watermark, batch_size=int(db_batch_size), prefix=db_prefix,
+                order_columns=list(ingest_schema['orders']), address_columns=list(ingest_schema['addresses'])
+            )
+        except ImportError:
+            st.error("MySQL support needs the pymysql package (pip install pymysql).")
+        except Exception as e:
+            st.error(f"Database pull failed: {e}")
+        else:
+            if pulled_orders.empty:
+                st.info("No new or modified orders since the last pull.")
             else:
-                df_orders_main = df_orders_clean[main_cols].copy()
-
-                merged_df = pd.merge(df_orders_main, df_meta_clean, left_on='id', right_on='order_id', how='left')
-                merged_df = pd.merge(merged_df, df_address_clean, left_on='id', right_on='order_id', how='left')
-
-                # Remove redundant ID columns
-                for col in ['order_id_x', 'order_id_y', 'order_id']:
-                    if col in merged_df.columns and col != 'id':
-                        merged_df.drop(col, axis=1, inplace=True)
-
-                columns_to_drop = [
-                    "tax_amount", "customer_id", "billing_email", "transaction_id", "_alg_wc_cog_order_item_cost",
-                    "_billing_address_index", "_billing_vat", "_edit_local", "_refund_amount", "_refund_reson",
-                    "_refunded_by", "_refunded_payment", "_shipping_addres_index", "_yith_pos_change",
-                    "_yith_pos_gateway_bacs", "_yith_pos_gateway_cheque", "_yith_pos_gateway_yith_pos_cash_gateway",
-                    "_yith_Pos_gateway_yith_pos_chip_pin_gateway", "_yith_pos_order", "id_billing", "id_shipping",
-                    "first_name_shipping", "last_name_shipping", "company_billing", "company_shipping",
-                    "address_1_shipping", "address_2_billing", "address_2_shipping", "city_billing", "city_shipping",
-                    "state_billing", "state_shipping", "postcode_billing", "country_billing", "email_shipping",
-                    "phone_shipping", "_refund_reason", "_alg_wc_cog_order_profit_percent", "_alg_wc_cog_order_cost",
-                    "_edit_lock", "_shipping_address_index", "_yith_pos_gateway_yith_pos_chip_pin_gateway",
-                    "address_1_billing", "postcode_shipping", "country_shipping", "type", "payment_method", "total_amount"
-                ]
-                merged_df.drop(columns=[c for c in columns_to_drop if c in merged_df.columns], inplace=True, errors='ignore')
-
-                # Replace status values
-                status_map = {
-                    "wc-completed": "Order Complete",
-                    "wc-refunded": "Order Refunded",
-                    "wc-cancelled": "Order Cancelled"
-                }
-                if 'status' in merged_df.columns:
-                    merged_df['status'] = merged_df['status'].replace(status_map)
-
-                # Replace _yith_pos_register values
-                register_map = {
-                    22: "Register #1",
-                    165: "Register #1",
-                    23: "Register #2",
-                    166: "Register #2"
-                }
-                if '_yith_pos_register' in merged_df.columns:
-                    merged_df['_yith_pos_register'] = merged_df['_yith_pos_register'].replace(register_map)
-
-                # Replace _yith_pos_store values
-                store_map = {
-                    21: "Muscat Branch",
-                    164: "Sohar Branch"
-                }
-                if '_yith_pos_store' in merged_df.columns:
-                    merged_df['_yith_pos_store'] = merged_df['_yith_pos_store'].replace(store_map)
-
-                # Replace _yith_pos_cashier values with a default for unmapped IDs
-                cashier_map = {
-                    1: "Sameer Siddiqui",
-                    2: "Mahmood Al Ajmi",
-                    4: "Mohamed Hasir",
-                    6: "Sohar Cashier #1",
-                    11: "Almonther Alshibli",
-                    12: "Mohamed Ajmal"
-                }
-                if '_yith_pos_cashier' in merged_df.columns:
-                    merged_df['_yith_pos_cashier'] = merged_df['_yith_pos_cashier'].map(cashier_map)
-
-                # Format numeric columns
-                three_decimal_cols = ['_alg_wc_cog_order_items_cost', '_alg_wc_cog_order_price', '_alg_wc_cog_order_profit']
-                for col in three_decimal_cols:
-                    if col in merged_df.columns:
-                        merged_df[col] = pd.to_numeric(merged_df[col], errors='coerce')
-                        merged_df[col] = merged_df[col].apply(lambda x: f"OMR {x:.3f}" if pd.notnull(x) else x)
-
-                if '_alg_wc_cog_order_profit_margin' in merged_df.columns:
-                    merged_df['_alg_wc_cog_order_profit_margin'] = pd.to_numeric(merged_df['_alg_wc_cog_order_profit_margin'], errors='coerce')
-                    merged_df['_alg_wc_cog_order_profit_margin'] = merged_df['_alg_wc_cog_order_profit_margin'].apply(lambda x: f"{x:.2f}%" if pd.notnull(x) else x)
-
-                # Rename columns as requested
-                rename_map = {
-                    'id': 'Order ID',
-                    'status': 'Order Status',
-                    'date_created_gmt': 'Order Date',
-                    'payment_method_title': 'Payment Method',
-                    'customer_note': 'Purchase Note',
-                    '_alg_wc_cog_order_items_cost': 'Cost of Goods',
-                    '_alg_wc_cog_order_price': 'Selling Price',
-                    '_alg_wc_cog_order_profit': 'Profit (OMR)',
-                    '_alg_wc_cog_order_profit_margin': 'Profit (%)',
-                    '_yith_pos_cashier': "Cashier Name",
-                    '_yith_pos_register': 'POS Register',
-                    'first_name_billing': 'Customer FName',
-                    'last_name_billing': 'Customer LName',
-                    'email_billing': 'Customer Email',
-                    '_yith_pos_store': 'POS Store',
-                    'phone_billing': 'Customer Phone'
-                }
-                merged_df.rename(columns=rename_map, inplace=True)
-
-                desired_order = [
-                    'Order ID', 'Order Status', 'Order Date',
-                    "Cashier Name", 'POS Register', 'POS Store',
-                    'Cost of Goods', 'Selling Price', 'Profit (OMR)', 'Profit (%)',
-                    'Customer FName', 'Customer LName', 'Customer Email',
-                    'Customer Phone', 'Purchase Note'
-                ]
-                final_columns = [col for col in desired_order if col in merged_df.columns]
-                merged_df = merged_df[final_columns]
-
-                # Store in session state
-                st.session_state["merged_df"] = merged_df
-                st.session_state["df_orders_main"] = df_orders_main
-
-# If merged_df is in session state, display it and show stats
-if "merged_df" in st.session_state:
-    merged_df = st.session_state["merged_df"]
-    df_orders_main = st.session_state["df_orders_main"]
-
-    # Convert Order Date to datetime properly
-    # Assuming format "dd-mm-yyyy HH:MM"
-    merged_df['Order Date'] = pd.to_datetime(merged_df['Order Date'], format="%d-%m-%Y %H:%M", errors='coerce')
+                try:
+                    pulled_df, _ = build_report(pulled_orders, pivot_meta(pulled_meta), pulled_address)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    updated_df = upsert_orders(base_df, pulled_df) if watermark else pulled_df
+                    version = save_base(updated_df, pulled_df, base_version if watermark else None)
+                    store_db_watermark(new_watermark)
+                    set_report(updated_df, version)
+                    st.success(f"Pulled {len(pulled_df)} orders; the report now holds {len(updated_df)} orders.")
+
+# Client-side number formats for the order table, matching display_formats
+table_columns = {
+    'Cost of Goods': st.column_config.NumberColumn(format="OMR %.3f"),
+    'Selling Price': st.column_config.NumberColumn(format="OMR %.3f"),
+    'Profit (OMR)': st.column_config.NumberColumn(format="OMR %.3f"),
+    'Profit (%)': st.column_config.NumberColumn(format="%.2f%%")
+}
+
+# The order table runs in a fragment so paging, sorting and filtering rerun only the table
+@st.fragment
+def render_order_table(merged_df, version):
+    # Sort orders and lookup indexes are built once per dataset and shared by every session
+    index = registry.derived(version, 'order_index', lambda: OrderIndex(merged_df))
+
+    with st.expander("Filter & Sort Orders"):
+        filters = {}
+        for col, widget_col in zip(filter_columns, st.columns(len(filter_columns))):
+            with widget_col:
+                filters[col] = st.multiselect(col, index.options(col), key=f"filter_{col}")
+        d1, d2, d3, d4 = st.columns(4)
+        with d1:
+            date_range = st.date_input("Order date range", value=(), key="filter_dates")
+        with d2:
+            search = st.text_input("Phone, email or Order ID", key="filter_search")
+        with d3:
+            sort_by = st.selectbox("Sort by", [c for c in sortable_columns if c in merged_df.columns], key="sort_by")
+        with d4:
+            descending = st.toggle("Descending", key="sort_descending")
+
+    # The date picker returns a single date while the range is still being chosen
+    date_range = tuple(date_range) if len(date_range) == 2 else None
+    positions = index.query(filters, date_range, search, sort_by, not descending)
 
     # Pagination
-    rows_per_page = 10
-    total_rows = len(merged_df)
-    total_pages = (total_rows // rows_per_page) + (1 if total_rows % rows_per_page > 0 else 0)
-    page_num = st.number_input("Page number", min_value=1, max_value=max(total_pages, 1), value=1)
-    start = (page_num - 1) * rows_per_page
-    end = start + rows_per_page
-    page_data = merged_df.iloc[start:end]
-
-    def alternate_row_colors(row):
-        return ['background-color: #f9f9f9' if row.name % 2 else 'background-color: #ffffff' for _ in row]
-
-    styled = (
-        page_data.style
-        .apply(alternate_row_colors, axis=1)
-        .set_table_styles([
-            {'selector': 'th',
-             'props': [('background-color', '#4F81BD'),
-                       ('color', 'black'),
-                       ('font-weight', 'bold'),
-                       ('text-align', 'center')]}
-        ], overwrite=False)
-        .set_properties(**{'color':'black'})
-        .hide(axis='index')
+    p1, p2 = st.columns(2)
+    with p2:
+        rows_per_page = st.selectbox("Rows per page", page_sizes, key="rows_per_page")
+    total_pages = max(-(-len(positions) // rows_per_page), 1)
+    with p1:
+        page_num = st.number_input(f"Page number (of {total_pages})", min_value=1, max_value=total_pages, value=1)
+    st.caption(f"{len(positions)} of {index.size} orders")
+
+    st.dataframe(index.page(positions, page_num, rows_per_page), hide_index=True, column_config=table_columns)
+
+export_labels = {
+    'csv.gz': "CSV (gzip)",
+    'parquet': "Parquet",
+    'xlsx': "Excel (requires openpyxl)"
+}
+
+# The export file is only written when requested, in chunks to a temporary file
+@st.fragment
+def render_export(merged_df):
+    with st.expander("Export Combined Data"):
+        e1, e2, e3 = st.columns(3)
+        with e1:
+            export_format = st.selectbox("Format", list(export_formats), format_func=export_labels.get, key="export_format")
+        with e2:
+            export_dates = st.date_input("Order date range", value=(), key="export_dates")
+        with e3:
+            export_stores = st.multiselect("Stores", list(merged_df['POS Store'].dropna().unique()), key="export_stores")
+
+        if st.button("Prepare Export"):
+            try:
+                path, rows = write_export(
+                    merged_df, export_format,
+                    date_range=tuple(export_dates) if len(export_dates) == 2 else None,
+                    stores=export_stores
+                )
+            except ImportError:
+                st.error("Excel export needs the openpyxl package (pip install openpyxl).")
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                # The button takes the file contents now, so the temporary file can go straight away
+                with open(path, "rb") as f:
+                    st.download_button(
+                        label=f"Download {rows} orders",
+                        data=f,
+                        file_name=f"combined_woocommerce_data.{export_format}",
+                        mime=export_formats[export_format]
+                    )
+                os.remove(path)
+
+def summary_table(summary, label):
+    return pd.DataFrame({
+        label: list(summary.keys()),
+        "Number of Orders": [v['Number_of_Orders'] for v in summary.values()],
+        "Total Sales (OMR)": [f"{v['Total_Sales']:.3f}" for v in summary.values()],
+        "Total Profit (OMR)": [f"{v['Total_Profit']:.3f}" for v in summary.values()],
+        "Cancellations": [v['Cancellations'] for v in summary.values()]
+    })
+
+# Custom ranges are answered from the daily rollup, so changing the dates never rescans the orders
+@st.fragment
+def render_custom_range(merged_df, version):
+    cube = registry.derived(version, 'cube', lambda: build_cube(merged_df))
+    st.subheader("Custom Date Range", divider="rainbow")
+
+    c1, c2 = st.columns(2)
+    with c1:
+        last_day = merged_df['Order Date'].max().normalize()
+        custom_range = st.date_input("Date range", value=(last_day - pd.Timedelta(days=6), last_day), key="custom_range")
+    with c2:
+        compare = st.toggle("Compare with the previous period", value=True, key="custom_compare")
+    if len(custom_range) != 2:
+        st.info("Pick the last day of the range.")
+        return
+    start, end = custom_range
+
+    d1, d2 = st.columns(2)
+    with d1:
+        stores = sorted(cube_summary(cube, start, end)['store_summary'])
+        store = st.selectbox("Store", [None] + stores, format_func=lambda s: s or "All stores", key="drill_store")
+    with d2:
+        registers = sorted(cube_summary(cube, start, end, {'POS Store': store})['register_summary']) if store else []
+        register = st.selectbox("Register", [None] + registers, format_func=lambda r: r or "All registers", key="drill_register", disabled=not store)
+
+    filters = {'POS Store': store, 'POS Register': register}
+    stats = cube_summary(cube, start, end, filters)
+    previous = cube_summary(cube, *previous_period(start, end), filters) if compare else None
+
+    m1, m2, m3, m4 = st.columns(4)
+    for column, label, key, fmt in [
+        (m1, "Number of Orders", 'orders', "{:.0f}"),
+        (m2, "Total Sales (OMR)", 'sales', "{:.3f}"),
+        (m3, "Total Profit (OMR)", 'profit', "{:.3f}"),
+        (m4, "Cancellations/Refunds", 'cancellations', "{:.0f}")
+    ]:
+        with column:
+            delta = fmt.format(stats[key] - previous[key]) if previous is not None else None
+            st.metric(label, fmt.format(stats[key]), delta=delta, delta_color="inverse" if key == 'cancellations' else "normal")
+
+    # Drill-down: stores, then the registers of the picked store, then the cashiers of the picked register
+    if register:
+        st.write(f"#### Cashiers on {register} at {store}:")
+        st.dataframe(summary_table(stats['cashier_summary'], "Cashier"), hide_index=True)
+    elif store:
+        st.write(f"#### Registers at {store}:")
+        st.dataframe(summary_table(stats['register_summary'], "Register"), hide_index=True)
+    else:
+        st.write("#### By Store:")
+        st.dataframe(summary_table(stats['store_summary'], "Store"), hide_index=True)
+
+# Client-side number formats for the product table
+product_columns = {
+    'Sales': st.column_config.NumberColumn("Sales (OMR)", format="%.3f"),
+    'Cost': st.column_config.NumberColumn("Cost (OMR)", format="%.3f"),
+    'Profit': st.column_config.NumberColumn("Profit (OMR)", format="%.3f"),
+    'Refunded Sales': st.column_config.NumberColumn("Refunded Sales (OMR)", format="%.3f"),
+    'Margin (%)': st.column_config.NumberColumn(format="%.2f%%")
+}
+
+# Product lines are joined to the report once; changing the period or breakdown only regroups them
+@st.fragment
+def render_products(merged_df, version):
+    st.subheader("Product Analytics", divider="rainbow")
+    lines = current_line_items(version)
+    if lines is None:
+        if items_file is None or itemmeta_file is None:
+            st.info("Upload wp_woocommerce_order_items and wp_woocommerce_order_itemmeta above to see sales, cost and profit by product.")
+            return
+        if not st.button("Build Product Report"):
+            return
+        key = items_key([items_file, itemmeta_file], version)
+        lines = registry.get(key)
+        if lines is None:
+            lines = load_cached_dataset(key)
+        if lines is None:
+            try:
+                with st.spinner("Joining order items to the report..."):
+                    lines = load_line_items(merged_df, items_file, itemmeta_file)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            store_cached_dataset(key, lines)
+        set_line_items(lines, key, version)
+
+    windows = report_windows()
+    p1, p2, p3 = st.columns(3)
+    with p1:
+        period = st.selectbox("Period", list(windows), index=len(windows) - 1, key="product_period")
+    with p2:
+        by = st.selectbox("Break down by", [None] + list(product_breakdowns), format_func=lambda b: f"By {b}" if b else "Products only", key="product_by")
+    with p3:
+        stores = sorted(lines['POS Store'].dropna().unique())
+        store = st.selectbox("Store", [None] + stores, format_func=lambda s: s or "All stores", key="product_store")
+
+    summary = product_summary(lines, start=windows[period], by=by, filters={'POS Store': store})
+    st.caption(f"{len(summary)} rows from {len(lines)} order lines")
+    st.dataframe(summary, hide_index=True, column_config=product_columns)
+
+# Client-side number formats for the customer tables
+customer_columns = {
+    'Sales': st.column_config.NumberColumn("Sales (OMR)", format="%.3f"),
+    'Profit': st.column_config.NumberColumn("Profit (OMR)", format="%.3f"),
+    'Avg Sales': st.column_config.NumberColumn("Avg Sales (OMR)", format="%.3f"),
+    'Avg Profit': st.column_config.NumberColumn("Avg Profit (OMR)", format="%.3f"),
+    'Avg Recency (days)': st.column_config.NumberColumn(format="%.0f"),
+    'Avg Orders': st.column_config.NumberColumn(format="%.2f"),
+    'Repeat Rate': st.column_config.NumberColumn(format="percent")
+}
+
+# Customers are indexed once per dataset and shared by every session; the widgets only regroup the index
+@st.fragment
+def render_customers(merged_df, version):
+    customers = registry.derived(version, 'customer_index', lambda: CustomerIndex(merged_df))
+    st.subheader("Customer Analytics", divider="rainbow")
+
+    store = st.selectbox("Store", [None] + sorted(customers.stores()), format_func=lambda s: s or "All stores", key="customer_store")
+    repeat = customers.repeat_rate(store)
+    value = customers.lifetime_value(store)
+    m1, m2, m3, m4 = st.columns(4)
+    with m1:
+        st.metric("Customers", f"{repeat['customers']}")
+    with m2:
+        st.metric("Repeat Customers", f"{repeat['repeat_rate']:.1%}", help=f"{repeat['repeat_customers']} customers with more than one order, placing {repeat['repeat_order_share']:.1%} of the orders")
+    with m3:
+        st.metric("Avg Lifetime Sales (OMR)", f"{value['mean_sales']:.3f}")
+    with m4:
+        st.metric("Median Lifetime Sales (OMR)", f"{value['median_sales']:.3f}")
+    st.caption(
+        "Customers are matched on their phone number, or their email when the order has no phone. "
+        f"Cancelled and refunded orders are not counted, and {customers.anonymous_orders} orders with neither contact are left out."
     )
 
-    st.markdown(styled.to_html(), unsafe_allow_html=True)
+    top_tab, rfm_tab, cohort_tab = st.tabs(["Top Customers", "RFM Segments", "Cohorts"])
+    with top_tab:
+        top_n = st.selectbox("Customers shown", [10, 25, 50, 100], key="customer_top_n")
+        st.dataframe(customers.top_customers(store, top_n), hide_index=True, column_config=customer_columns)
+    with rfm_tab:
+        st.write("Recency, frequency and sales are scored from 1 to 5 against all customers, counting from the latest order in the report.")
+        st.dataframe(customers.segment_summary(), hide_index=True, column_config=customer_columns)
+    with cohort_tab:
+        st.write("Customers grouped by the month of their first order, with their average value to date.")
+        cohorts = customers.cohorts()
+        st.line_chart(cohorts['Avg Sales'])
+        st.dataframe(cohorts, column_config=customer_columns)
 
-    # Download button
-    csv_buffer = io.StringIO()
-    merged_df.drop(columns=['Profit (OMR)_num', 'Selling Price_num'], errors='ignore').to_csv(csv_buffer, index=False)
-    st.download_button(
-        label="Download Combined CSV",
-        data=csv_buffer.getvalue(),
-        file_name="combined_woocommerce_data.csv",
-        mime="text/csv"
-    )
+# If this session has a report, display it and show stats
+merged_df = current_report()
+if merged_df is not None:
 
+    dataset_version = st.session_state["dataset_version"]
+    aggregates = report_aggregates(dataset_version, merged_df, analytics_backend)
 
-    # Helper functions to strip "OMR " from numeric fields
-    def omr_to_float(val):
-        if isinstance(val, str) and val.startswith("OMR"):
-            return float(val.replace("OMR", "").strip())
-        return pd.to_numeric(val, errors='coerce')
-
-    merged_df['Profit (OMR)_num'] = merged_df['Profit (OMR)'].apply(omr_to_float)
-    merged_df['Selling Price_num'] = merged_df['Selling Price'].apply(omr_to_float)
-
-    now = pd.Timestamp.now()
-    last_30_days = now - pd.Timedelta(days=30)
-    last_6_months = now - pd.DateOffset(months=6)
-    last_1_year = now - pd.DateOffset(years=1)
-
-    def compute_stats(df):
-        total_orders = df['Order ID'].nunique()
-        total_sales = df['Selling Price_num'].sum()
-        total_profit = df['Profit (OMR)_num'].sum()
-        cancellations = df['Order Status'].isin(['Order Cancelled', 'Order Refunded']).sum()
-
-        # Detailed summaries
-        store_summary = df.groupby('POS Store').agg(
-            Number_of_Orders=('Order ID', 'nunique'),
-            Total_Sales=('Selling Price_num', 'sum'),
-            Total_Profit=('Profit (OMR)_num', 'sum'),
-            Cancellations=('Order Status', lambda x: x.isin(['Order Cancelled', 'Order Refunded']).sum())
-        ).to_dict('index') if 'POS Store' in df.columns else {}
-
-        register_summary = df.groupby('POS Register').agg(
-            Number_of_Orders=('Order ID', 'nunique'),
-            Total_Sales=('Selling Price_num', 'sum'),
-            Total_Profit=('Profit (OMR)_num', 'sum'),
-            Cancellations=('Order Status', lambda x: x.isin(['Order Cancelled', 'Order Refunded']).sum())
-        ).to_dict('index') if 'POS Register' in df.columns else {}
-
-        cashier_summary = df.groupby("Cashier Name").agg(
-            Number_of_Orders=('Order ID', 'nunique'),
-            Total_Sales=('Selling Price_num', 'sum'),
-            Total_Profit=('Profit (OMR)_num', 'sum'),
-            Cancellations=('Order Status', lambda x: x.isin(['Order Cancelled', 'Order Refunded']).sum())
-        ).to_dict('index') if "Cashier Name" in df.columns else {}
-
-        return {
-            'orders': total_orders,
-            'sales': total_sales,
-            'profit': total_profit,
-            'cancellations': cancellations,
-            'store_summary': store_summary,
-            'register_summary': register_summary,
-            'cashier_summary': cashier_summary
-        }
-
-    # Filtered DataFrames
-    df_30d = merged_df[merged_df['Order Date'] >= last_30_days]
-    df_6m = merged_df[merged_df['Order Date'] >= last_6_months]
-    df_1y = merged_df[merged_df['Order Date'] >= last_1_year]
-    df_all = merged_df.copy()
-
-    stats_30d = compute_stats(df_30d)
-    stats_6m = compute_stats(df_6m)
-    stats_1y = compute_stats(df_1y)
-    stats_all = compute_stats(df_all)
+    render_order_table(merged_df, dataset_version)
+
+    render_export(merged_df)
 
-    # Summary Statistics Section (Updated with 2x2 Grid and Expanders)
-    st.subheader("Summary Statistics", divider="rainbow")
 
     # Define the time periods and their corresponding stats
-    time_periods = {
-        "Last 30 Days": stats_30d,
-        "Last 6 Months": stats_6m,
-        "Last 1 Year": stats_1y,
-        "All Time": stats_all
-    }
+    time_periods = aggregates['time_periods']
+
+    # Summary Statistics Section (Updated with 2x2 Grid and Expanders)
+    st.subheader("Summary Statistics", divider="rainbow")
 
     # Create a 2x2 grid layout
     with st.container():
@@ -581,6 +923,14 @@ if "merged_df" in st.session_state:
     # Separator for clarity
     st.markdown("---")
 
+    if 'Order Date' in merged_df.columns and merged_df['Order Date'].notna().any():
+        render_custom_range(merged_df, dataset_version)
+
+    render_products(merged_df, dataset_version)
+
+    if 'Customer Phone' in merged_df.columns or 'Customer Email' in merged_df.columns:
+        render_customers(merged_df, dataset_version)
+
     # ---- Additional KPIs and Visualizations ----
     st.subheader("Key Performance Indicators & Visualizations", divider="rainbow")
 
@@ -589,16 +939,12 @@ if "merged_df" in st.session_state:
         # Order Status Distribution
         if 'Order Status' in merged_df.columns:
             st.write("### Order Status Distribution (All Time)")
-            status_counts = merged_df['Order Status'].value_counts()
-            st.bar_chart(status_counts)
+            st.bar_chart(aggregates['status_counts'])
         
         # Cashier-wise Performance
         st.write("### Cashier Wise Performance Profit/All Time")
         if "Cashier Name" in merged_df.columns:
-            cashier_perf = (
-                merged_df.groupby("Cashier Name")['Profit (OMR)_num'].sum().sort_values(ascending=False)
-            )
-            st.bar_chart(cashier_perf)
+            st.bar_chart(aggregates['cashier_performance'])
 
 
     with vis2:
@@ -606,18 +952,52 @@ if "merged_df" in st.session_state:
         # Sales over Month
         st.write("### Monthly Sales Trend")
         if 'Order Date' in merged_df.columns:
-            monthly_sales = (
-                merged_df.groupby(merged_df['Order Date'].dt.to_period('M'))['Selling Price_num'].sum()
-                .rename("Total Sales")
-                .reset_index()
-            )
-            monthly_sales['Order Date'] = monthly_sales['Order Date'].dt.to_timestamp()
-            st.line_chart(monthly_sales.set_index('Order Date')['Total Sales'])
+            st.line_chart(aggregates['monthly_sales'])
 
         # Store-wise Performance
         st.write("### Store Wise Performance (By Total Sales/All Time)")
         if 'POS Store' in merged_df.columns:
-            store_perf = (
-                merged_df.groupby('POS Store')['Selling Price_num'].sum().sort_values(ascending=False)
-            )
-            st.bar_chart(store_perf)
\ No newline at end of file
+            st.bar_chart(aggregates['store_performance'])
+
+# Lists every build on this server, including watched-folder builds, refreshed while the page is open
+@st.fragment(run_every=5.0)
+def render_builds():
+    if watcher is not None:
+        st.caption(f"Watching {watch_dir} every {watcher.interval:.0f}s" + (f" (last check failed: {watcher.last_error})" if watcher.last_error else ""))
+    recent = jobs.recent()
+    if not recent:
+        st.write("No builds yet.")
+        return
+    st.dataframe(pd.DataFrame([job.status() for job in recent]), hide_index=True)
+    for job in recent:
+        if job.active:
+            st.button(f"Cancel {job.key[:12]}", key=f"cancel_{job.key}", on_click=job.cancel)
+    finished = {job.key: f"{job.label} ({job.key[:12]})" for job in recent if job.state == 'done' and job.key != st.session_state.get("dataset_version")}
+    if finished:
+        pick = st.selectbox("Finished build", list(finished), format_func=finished.get, key="open_build")
+        if st.button("Open report"):
+            if attach_report(pick) is None:
+                st.error("That report is no longer cached; build it again.")
+            else:
+                st.rerun()
+
+with st.sidebar.expander("Background Builds", expanded=False):
+    render_builds()
+
+with st.sidebar.expander("Resident Datasets", expanded=False):
+    st.write(f"**Memory in use:** {registry.resident_bytes() / 2**20:.1f} MB of {registry.max_bytes / 2**20:.0f} MB")
+    st.dataframe(pd.DataFrame(registry.resident()), hide_index=True)
+
+if collect_diagnostics:
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        if stage_records:
+            st.dataframe(pd.DataFrame(stage_records), hide_index=True)
+            st.write(f"**Total stage time:** {sum(r['seconds'] for r in stage_records):.3f}s")
+        else:
+            st.write("No pipeline stages ran in this run.")
+        # Report builds run on the background worker and record their stages on the job
+        last_build = jobs.get(st.session_state.get("last_build") or st.session_state.get("build_job") or "")
+        if last_build is not None and last_build.records:
+            st.write(f"**Background build {last_build.key[:12]}** ({last_build.state}):")
+            st.dataframe(pd.DataFrame(last_build.records), hide_index=True)
+            st.write(f"**Total stage time:** {sum(r['seconds'] for r in last_build.records):.3f}s")
\ No newline at end of file
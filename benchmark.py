@@ -0,0 +1,133 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import pandas as pd
+
+import synth_data
+from report_checks import check_exports
+from report_cube import build_cube, cube_summary
+from report_customers import CustomerIndex
+from report_items import build_line_items, product_summary, read_item_meta_rows
+from report_pipeline import (
+    main_cols, ingest, read_table, read_meta_rows, pivot_meta, preprocess_orders, preprocess_address, merge_tables, apply_mappings,
+    format_for_display, report_windows, compute_stats, status_counts, monthly_sales, cashier_performance,
+    store_performance
+)
+
+
+def shape_of(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return {'rows': len(result), 'columns': result.shape[1] if result.ndim == 2 else 1}
+    return {}
+
+
+def run_stage(results, name, fn, *args, memory=True):
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    out = fn(*args)
+    seconds = time.perf_counter() - started
+    record = {'stage': name, 'seconds': round(seconds, 4)}
+    if memory:
+        # numpy and pandas buffers are reported to tracemalloc, so this covers the frame allocations
+        record['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    record.update(shape_of(out))
+    results.append(record)
+    print(f"{name:<20} {seconds:>9.3f}s" + (f" {record['peak_mb']:>10.1f} MB" if memory else ""))
+    return out
+
+
+def charts(df):
+    return status_counts(df), monthly_sales(df), cashier_performance(df), store_performance(df)
+
+
+def customer_metrics(customers):
+    return customers.repeat_rate(), customers.lifetime_value(), customers.top_customers(), customers.segment_summary(), customers.cohorts()
+
+
+def run(paths, memory=True):
+    results = []
+    run_stage(results, 'check_exports', check_exports, paths['orders'], paths['meta'], paths['addresses'], memory=memory)
+    df_orders = run_stage(results, 'load_orders', read_table, paths['orders'], 'orders', memory=memory)
+    df_meta_rows = run_stage(results, 'load_meta', read_meta_rows, paths['meta'], memory=memory)
+    df_address = run_stage(results, 'load_addresses', read_table, paths['addresses'], 'addresses', memory=memory)
+
+    df_orders = run_stage(results, 'preprocess_orders', preprocess_orders, df_orders, memory=memory)
+    df_meta = run_stage(results, 'pivot_meta', pivot_meta, df_meta_rows, memory=memory)
+    df_address = run_stage(results, 'preprocess_address', preprocess_address, df_address, memory=memory)
+    del df_meta_rows
+
+    df_orders_main = df_orders[main_cols].copy()
+    merged_df = run_stage(results, 'merge', merge_tables, df_orders_main, df_meta, df_address, memory=memory)
+    del df_orders, df_meta, df_address
+    merged_df = run_stage(results, 'apply_mappings', apply_mappings, merged_df, memory=memory)
+    run_stage(results, 'format_for_display', format_for_display, merged_df, memory=memory)
+
+    run_stage(results, 'compute_stats', compute_stats, merged_df, report_windows(), memory=memory)
+    run_stage(results, 'charts', charts, merged_df, memory=memory)
+    cube = run_stage(results, 'build_cube', build_cube, merged_df, memory=memory)
+    run_stage(results, 'cube_summary', cube_summary, cube, merged_df['Order Date'].min(), merged_df['Order Date'].max(), memory=memory)
+    customers = run_stage(results, 'customer_index', CustomerIndex, merged_df, memory=memory)
+    run_stage(results, 'customer_metrics', customer_metrics, customers, memory=memory)
+
+    if 'items' in paths:
+        df_items = run_stage(results, 'load_items', read_table, paths['items'], 'items', memory=memory)
+        df_item_meta = run_stage(results, 'load_itemmeta', read_item_meta_rows, paths['itemmeta'], memory=memory)
+        lines = run_stage(results, 'build_line_items', build_line_items, merged_df, df_items, df_item_meta, memory=memory)
+        del df_items, df_item_meta
+        run_stage(results, 'product_summary', product_summary, lines, None, None, 'store', memory=memory)
+
+    # The three load-and-preprocess branches again, run concurrently as the app does
+    run_stage(results, 'ingest_parallel', ingest, paths['orders'], paths['meta'], paths['addresses'], memory=memory)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile each report pipeline stage.")
+    parser.add_argument("--scale", choices=list(synth_data.scales), default='10k')
+    parser.add_argument("--orders", type=int, help="exact number of orders; overrides --scale")
+    parser.add_argument("--data-dir", help="directory with the exports (default: bench_data/<scale>, generated if missing)")
+    parser.add_argument("--out", help="results file (default: bench_results_<scale>.json)")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows allocation-heavy stages")
+    args = parser.parse_args(argv)
+
+    label = str(args.orders) if args.orders else args.scale
+    data_dir = args.data_dir or os.path.join("bench_data", label)
+    paths = {
+        'orders': os.path.join(data_dir, 'wp_wc_orders.csv'),
+        'meta': os.path.join(data_dir, 'wp_wc_orders_meta.csv'),
+        'addresses': os.path.join(data_dir, 'wp_wc_order_addresses.csv'),
+        'items': os.path.join(data_dir, 'wp_woocommerce_order_items.csv'),
+        'itemmeta': os.path.join(data_dir, 'wp_woocommerce_order_itemmeta.csv')
+    }
+    if not all(os.path.exists(p) for p in paths.values()):
+        print(f"Generating synthetic data in {data_dir}")
+        synth_data.generate(args.orders or synth_data.scales[args.scale], data_dir)
+
+    started = time.perf_counter()
+    stages = run(paths, memory=not args.no_memory)
+    report = {
+        'scale': label,
+        'data_dir': data_dir,
+        'file_mb': {name: round(os.path.getsize(p) / 2**20, 2) for name, p in paths.items()},
+        'run_at': pd.Timestamp.now().isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'total_seconds': round(time.perf_counter() - started, 4),
+        'stages': stages
+    }
+    out = args.out or f"bench_results_{label}.json"
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
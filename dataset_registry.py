@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory budget for report frames held by this server process, shared by every browser session
+registry_max_bytes = int(os.environ.get("REPORT_REGISTRY_MAX_MB", "1024")) * 1024 * 1024
+# Sessions cannot report that they closed, so a session that has not read a dataset for this long stops pinning it
+session_idle_seconds = int(os.environ.get("REPORT_SESSION_IDLE_MINUTES", "60")) * 60
+
+
+def value_bytes(value):
+    # Frames report their own memory; index classes and arrays expose nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return int(getattr(value, 'nbytes', 0))
+
+
+class DatasetRegistry:
+    # Built reports keyed by content hash; sessions keep the key and read the one shared frame.
+    # Frames are never modified after they are registered, so readers need no copies
+    def __init__(self, max_bytes=registry_max_bytes, idle_seconds=session_idle_seconds):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, df, session=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # A second session building the same files reuses the frame that is already resident
+                entry = {'df': df, 'bytes': value_bytes(df), 'sessions': {}, 'derived': {}}
+                self._entries[key] = entry
+            self._touch(key, session)
+            self._evict(keep=key)
+            return entry['df']
+
+    def get(self, key, session=None):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            return self._touch(key, session)['df']
+
+    def release(self, key, session):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['sessions'].pop(session, None)
+
+    def derived(self, key, name, build):
+        # Values computed from a dataset (such as the order table index) are shared and evicted with it,
+        # and their memory counts towards the budget along with the frame
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return build()
+        if name not in entry['derived']:
+            value = build()
+            with self._lock:
+                if name not in entry['derived']:
+                    entry['derived'][name] = value
+                    entry['bytes'] += value_bytes(value)
+                    self._evict(keep=key)
+                    # Indexes that build more structures on use report them, so those count as well
+                    if hasattr(value, 'on_grow'):
+                        value.on_grow = lambda delta: self.grow(key, delta)
+        return entry['derived'][name]
+
+    def grow(self, key, delta):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['bytes'] += delta
+                self._evict(keep=key)
+
+    def resident(self):
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    'dataset': key[:12],
+                    'rows': len(entry['df']),
+                    'memory_mb': round(entry['bytes'] / 2**20, 1),
+                    'sessions': self._pins(entry, now),
+                    'idle_seconds': round(now - entry['last_used'])
+                }
+                for key, entry in reversed(self._entries.items())
+            ]
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(entry['bytes'] for entry in self._entries.values())
+
+    def _touch(self, key, session):
+        entry = self._entries[key]
+        entry['last_used'] = time.time()
+        if session is not None:
+            entry['sessions'][session] = entry['last_used']
+        self._entries.move_to_end(key)
+        return entry
+
+    def _pins(self, entry, now):
+        for session, seen in list(entry['sessions'].items()):
+            if now - seen > self.idle_seconds:
+                del entry['sessions'][session]
+        return len(entry['sessions'])
+
+    def _evict(self, keep=None):
+        # Least recently used first; datasets an active session still holds are never dropped
+        now = time.time()
+        total = sum(entry['bytes'] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if key == keep or self._pins(entry, now):
+                continue
+            del self._entries[key]
+            total -= entry['bytes']
@@ -0,0 +1,127 @@
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class ConnectionPool:
+    # Small thread-safe pool; connections are created lazily up to `size` and reused afterwards
+    def __init__(self, connect, cursor=None, placeholder="?", size=4):
+        self.connect = connect
+        self.cursor = cursor or (lambda conn: conn.cursor())
+        self.placeholder = placeholder
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self.connect()
+        return self._idle.get()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def sqlite_pool(path, size=4):
+    # SQLite file with the WooCommerce schema; used for local runs and for testing the query layer
+    return ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), placeholder="?", size=size)
+
+
+def mysql_pool(host, user, password, database, port=3306, size=4):
+    import pymysql
+    from pymysql.cursors import SSCursor
+
+    def connect():
+        return pymysql.connect(host=host, port=port, user=user, password=password, database=database, charset="utf8mb4")
+
+    # SSCursor streams rows from the server instead of buffering the whole result set client-side
+    return ConnectionPool(connect, cursor=lambda conn: conn.cursor(SSCursor), placeholder="%s", size=size)
+
+
+def fetch_frame(pool, sql, params=(), batch_size=50_000):
+    parts = []
+    with pool.connection() as conn:
+        cur = pool.cursor(conn)
+        try:
+            cur.execute(sql, params)
+            columns = [d[0] for d in cur.description]
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                parts.append(pd.DataFrame.from_records(rows, columns=columns))
+        finally:
+            cur.close()
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(parts, ignore_index=True)
+
+
+def watermark_filter(pool, watermark, id_col="id", updated_col="date_updated_gmt"):
+    # New orders (id above the watermark) or orders modified since the last pull
+    if not watermark:
+        return "1=1", ()
+    p = pool.placeholder
+    return f"({id_col} > {p} OR {updated_col} > {p})", (watermark["id"], watermark["date_updated_gmt"])
+
+
+def select_list(columns, required=()):
+    # Column names come from the report's declared schema, never from user input
+    return "*" if columns is None else ", ".join(dict.fromkeys([*required, *columns]))
+
+
+def pull_tables(pool, meta_keys, watermark=None, batch_size=50_000, prefix="wp_", order_columns=None, address_columns=None):
+    # The table prefix is typed in by the user and cannot be a query parameter, so it is checked before
+    # it goes into any SQL
+    if not re.fullmatch(r"\w+", prefix, re.ASCII):
+        raise ValueError(f"Invalid table prefix {prefix!r}: use only letters, digits and underscores")
+    p = pool.placeholder
+    where, params = watermark_filter(pool, watermark)
+    order_ids = f"SELECT id FROM {prefix}wc_orders WHERE {where}"
+
+    df_orders = fetch_frame(pool, f"SELECT {select_list(order_columns, ('id', 'date_updated_gmt'))} FROM {prefix}wc_orders WHERE {where} ORDER BY id", params, batch_size)
+    key_list = ", ".join([p] * len(meta_keys))
+    df_meta = fetch_frame(
+        pool,
+        f"SELECT id, order_id, meta_key, meta_value FROM {prefix}wc_orders_meta "
+        f"WHERE meta_key IN ({key_list}) AND order_id IN ({order_ids})",
+        tuple(meta_keys) + params,
+        batch_size
+    )
+    df_address = fetch_frame(
+        pool,
+        f"SELECT {select_list(address_columns)} FROM {prefix}wc_order_addresses WHERE order_id IN ({order_ids})",
+        params,
+        batch_size
+    )
+
+    new_watermark = dict(watermark) if watermark else {"id": 0, "date_updated_gmt": ""}
+    if not df_orders.empty:
+        new_watermark["id"] = max(new_watermark["id"], int(df_orders["id"].max()))
+        updated = df_orders["date_updated_gmt"].dropna()
+        if not updated.empty:
+            new_watermark["date_updated_gmt"] = max(new_watermark["date_updated_gmt"], str(updated.max()))
+    return df_orders, df_meta, df_address, new_watermark
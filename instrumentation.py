@@ -0,0 +1,91 @@
+import contextvars
+import functools
+import json
+import logging
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger("report.stages")
+
+# List collecting stage records for the current run; None means instrumentation is off
+_records = contextvars.ContextVar("stage_records", default=None)
+
+# Callback told the name of each stage as it starts; background builds use it for progress and cancellation
+_listener = contextvars.ContextVar("stage_listener", default=None)
+
+
+def start_recording(log=True):
+    records = []
+    _records.set(records)
+    if log and not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return records
+
+
+def stop_recording():
+    _records.set(None)
+
+
+def listen(callback):
+    # Applies to the current context, and to worker threads started with a copy of it
+    _listener.set(callback)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def shape(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if hasattr(value, "shape"):
+        return value.shape[0], (value.shape[1] if len(value.shape) > 1 else 1)
+    return None, None
+
+
+def stage(fn):
+    # Records wall time, growth of the process peak RSS and frame shapes for each call while recording is on
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        listener = _listener.get()
+        if listener is not None:
+            listener(fn.__name__)
+        records = _records.get()
+        if records is None:
+            return fn(*args, **kwargs)
+
+        # Shapes are taken before the call because some stages modify their input in place
+        in_rows, in_cols = shape(next((a for a in args if hasattr(a, "shape")), None))
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        seconds = time.perf_counter() - started
+        rss_after = peak_rss_mb()
+
+        out_rows, out_cols = shape(result)
+        record = {
+            'stage': fn.__name__,
+            'seconds': round(seconds, 4),
+            'peak_rss_delta_mb': round(rss_after - rss_before, 1) if rss_before is not None else None,
+            'in_rows': in_rows,
+            'in_cols': in_cols,
+            'out_rows': out_rows,
+            'out_cols': out_cols
+        }
+        records.append(record)
+        logger.info(json.dumps(record))
+        return result
+    return wrapper
@@ -0,0 +1,163 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Columns offered as equality filters in the order table
+filter_columns = ['Order Status', 'POS Store', 'POS Register', "Cashier Name"]
+
+page_sizes = [10, 25, 50, 100]
+
+sortable_columns = [
+    'Order ID', 'Order Date', 'Order Status', "Cashier Name", 'POS Register', 'POS Store',
+    'Cost of Goods', 'Selling Price', 'Profit (OMR)', 'Profit (%)'
+]
+
+
+def normalize_phone(values):
+    # Local Omani numbers are 8 digits, so the last 8 digits match with or without the +968 prefix
+    digits = values.astype('string').str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True)
+    return digits.str[-8:]
+
+
+def normalize_email(values):
+    return values.astype('string').str.strip().str.lower()
+
+
+class KeyIndex:
+    # Row positions by key in CSR layout: rows are ordered by key code once, and the rows of each key are
+    # one slice of that order. Missing keys are left out
+    def __init__(self, keys):
+        codes, uniques = pd.factorize(keys)
+        self.keys = pd.Index(uniques)
+        order = np.argsort(codes, kind='stable')
+        self.positions = order[int((codes < 0).sum()):]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))])
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes + self.offsets.nbytes + int(self.keys.memory_usage(deep=True))
+
+    def get(self, key, default):
+        code = self.keys.get_indexer([key])[0]
+        if code < 0:
+            return default
+        return self.positions[self.offsets[code]:self.offsets[code + 1]]
+
+
+class OrderIndex:
+    # Built once per dataset version; page requests then only gather the rows they return
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.size = len(self.df)
+        self._sort_orders = {}
+        self._last = (None, None)
+        # Called with the size of structures built after the index, so an owner can account for them
+        self.on_grow = None
+
+        # Hash indexes: label -> row positions for every filter column
+        self.postings = {
+            col: self.df.groupby(col, sort=True, observed=True).indices
+            for col in filter_columns if col in self.df.columns
+        }
+        self.order_ids = pd.Index(self.df['Order ID'])
+        self.by_phone = self.lookup('Customer Phone', normalize_phone)
+        self.by_email = self.lookup('Customer Email', normalize_email)
+        self.dates = self.df['Order Date'].to_numpy()
+
+    def lookup(self, col, normalize):
+        if col not in self.df.columns:
+            return KeyIndex(pd.Series([], dtype='string'))
+        return KeyIndex(normalize(self.df[col]))
+
+    @property
+    def nbytes(self):
+        # The frame belongs to the dataset it indexes, so only the index structures count
+        arrays = [rows for postings in self.postings.values() for rows in postings.values()] + list(self._sort_orders.values())
+        return (
+            sum(rows.nbytes for rows in arrays) + int(self.order_ids.memory_usage(deep=True))
+            + self.by_phone.nbytes + self.by_email.nbytes + self.last_bytes(self._last)
+        )
+
+    def last_bytes(self, last):
+        # An unfiltered result is the sort permutation itself, which is already counted
+        key, positions = last
+        if positions is None or positions is self._sort_orders.get(key[3:]):
+            return 0
+        return positions.nbytes
+
+    def grew(self, delta):
+        if delta and self.on_grow is not None:
+            self.on_grow(delta)
+
+    def order_positions(self, order_id):
+        # Order IDs are unique in a built report; duplicated exports, which the integrity checks flag, fall back to a scan
+        if self.order_ids.is_unique:
+            found = self.order_ids.get_indexer([order_id])
+            return found[found >= 0]
+        return np.flatnonzero(self.order_ids == order_id)
+
+    def options(self, col):
+        return list(self.postings.get(col, {}))
+
+    def sort_order(self, col, ascending=True):
+        # Sort permutations are computed on first use and reused for every later page
+        key = (col, ascending)
+        if key not in self._sort_orders:
+            ordered = self.df[col].sort_values(ascending=ascending, kind='stable', na_position='last')
+            self._sort_orders[key] = ordered.index.to_numpy()
+            self.grew(self._sort_orders[key].nbytes)
+        return self._sort_orders[key]
+
+    def search_positions(self, term):
+        # Exact lookups only: an email address, an Order ID, or a phone number matched on its local digits
+        term = term.strip()
+        none = np.empty(0, dtype=np.intp)
+        if '@' in term:
+            return self.by_email.get(term.lower(), none)
+        digits = re.sub(r'\D', '', term)
+        if not digits:
+            return none
+        # Longer digit strings cannot be an int64 Order ID
+        hits = [self.order_positions(int(digits)) if len(digits) < 19 else none]
+        if len(digits) >= 8:
+            hits.append(self.by_phone.get(digits[-8:], none))
+        return np.concatenate(hits)
+
+    def matching_mask(self, filters, date_range, search):
+        mask = None
+        for col, values in filters.items():
+            if not values or col not in self.postings:
+                continue
+            col_mask = np.zeros(self.size, dtype=bool)
+            for value in values:
+                col_mask[self.postings[col].get(value, [])] = True
+            mask = col_mask if mask is None else mask & col_mask
+        if date_range:
+            start = np.datetime64(pd.Timestamp(date_range[0]))
+            end = np.datetime64(pd.Timestamp(date_range[1]) + pd.Timedelta(days=1))
+            date_mask = (self.dates >= start) & (self.dates < end)
+            mask = date_mask if mask is None else mask & date_mask
+        if search:
+            search_mask = np.zeros(self.size, dtype=bool)
+            search_mask[self.search_positions(search)] = True
+            mask = search_mask if mask is None else mask & search_mask
+        return mask
+
+    def query(self, filters=None, date_range=None, search="", sort_by='Order ID', ascending=True):
+        # Positions of matching rows in display order; the last result is kept so paging skips the filtering
+        key = (tuple((k, tuple(v)) for k, v in sorted((filters or {}).items())), date_range, search, sort_by, ascending)
+        last_key, last_positions = self._last
+        if key == last_key:
+            return last_positions
+        order = self.sort_order(sort_by, ascending)
+        mask = self.matching_mask(filters or {}, date_range, search)
+        positions = order if mask is None else order[mask[order]]
+        # One tuple assignment, so sessions sharing the index never see a key paired with another query's rows
+        last, self._last = self._last, (key, positions)
+        self.grew(self.last_bytes(self._last) - self.last_bytes(last))
+        return positions
+
+    def page(self, positions, page_num, page_size):
+        start = (page_num - 1) * page_size
+        return self.df.iloc[positions[start:start + page_size]]
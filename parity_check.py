@@ -0,0 +1,87 @@
+import argparse
+import math
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+import report_pipeline
+import report_sql
+import synth_data
+from report_pipeline import load_report, report_windows
+
+# Chart aggregations compared between the pandas and SQL backends
+chart_checks = ['status_counts', 'cashier_performance', 'monthly_sales', 'store_performance']
+
+
+def close(a, b, rel_tol=1e-9):
+    # Sums are accumulated in a different order by each engine, so floats are compared with a tolerance
+    if isinstance(a, dict):
+        return isinstance(b, dict) and set(a) == set(b) and all(close(a[k], b[k], rel_tol) for k in a)
+    return math.isclose(float(a), float(b), rel_tol=rel_tol, abs_tol=1e-9)
+
+
+def window_sets(df, now):
+    # The app's windows, plus windows that start before the data, inside it and after it
+    first = df['Order Date'].min()
+    return {
+        'report windows': report_windows(now),
+        'edges': {
+            "Before first order": first - pd.Timedelta(days=1),
+            "Mid history": first + (now - first) / 2,
+            "After last order": now + pd.Timedelta(days=1)
+        }
+    }
+
+
+def run(df, path, now):
+    failures = []
+    for name, windows in window_sets(df, now).items():
+        ok = close(report_pipeline.compute_stats(df, windows), report_sql.compute_stats(path, windows))
+        print(f"compute_stats ({name}): {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            failures.append(f"compute_stats ({name})")
+    for name in chart_checks:
+        expected = getattr(report_pipeline, name)(df)
+        actual = getattr(report_sql, name)(path)
+        ok = close({str(k): v for k, v in expected.items()}, {str(k): v for k, v in actual.items()})
+        print(f"{name}: {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            failures.append(name)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the DuckDB backend returns the same summaries and charts as pandas.")
+    parser.add_argument("files", nargs="*", help="wp_wc_orders, wp_wc_orders_meta and wp_wc_order_addresses exports (default: synthetic data)")
+    parser.add_argument("--orders", type=int, default=20_000, help="synthetic order count when no files are given")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if not report_sql.available():
+        print("error: the parity check needs the duckdb package (pip install duckdb)", file=sys.stderr)
+        return 2
+    if args.files and len(args.files) != 3:
+        parser.error("pass all three exports or none")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.files:
+            paths = args.files
+        else:
+            generated = synth_data.generate(args.orders, os.path.join(tmp, "data"), seed=args.seed)
+            paths = [generated['orders'], generated['meta'], generated['addresses']]
+        df, _ = load_report(*paths)
+        path = os.path.join(tmp, "report.parquet")
+        df.to_parquet(path, index=False)
+        failures = run(df, path, pd.Timestamp.now())
+
+    if failures:
+        print(f"{len(failures)} check(s) differ: {', '.join(failures)}", file=sys.stderr)
+        return 1
+    print("All checks match.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
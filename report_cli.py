@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+import instrumentation
+import report_sql
+from report_checks import check_exports, findings_summary
+from report_items import load_line_items, product_summary
+from report_pipeline import compute_stats, format_for_display, load_report, report_windows
+from report_store import base_stored, load_base_dataset
+
+
+def json_default(value):
+    # numpy scalars from the aggregations are not JSON serialisable as-is
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def base_window_stats(windows):
+    # The base is read once for all the windows, and only from the month partitions the earliest window
+    # overlaps: a single short window stays cheap on a long history, while All Time reads every month once
+    starts = list(windows.values())
+    return compute_stats(load_base_dataset(start=None if None in starts else min(starts)), windows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the WooCommerce & POS report without the Streamlit UI.")
+    parser.add_argument("orders", nargs="?", help="wp_wc_orders.csv export")
+    parser.add_argument("meta", nargs="?", help="wp_wc_orders_meta.csv export")
+    parser.add_argument("addresses", nargs="?", help="wp_wc_order_addresses.csv export")
+    parser.add_argument("--items", nargs=2, metavar=("ITEMS", "ITEMMETA"), help="wp_woocommerce_order_items and wp_woocommerce_order_itemmeta exports for a product summary")
+    parser.add_argument("--from-base", action="store_true", help="summarize the stored base dataset instead of exports (no combined data files are written)")
+    parser.add_argument("--window", choices=list(report_windows()), help="with --from-base, summarize only this window (default: all four)")
+    parser.add_argument("--out-dir", default=".", help="directory for the report files (default: current directory)")
+    parser.add_argument("--name", default="combined_woocommerce_data", help="base name of the output files")
+    parser.add_argument("--format", choices=["csv", "parquet", "both"], default="csv", help="combined data format")
+    parser.add_argument("--chunksize", type=int, default=250_000, help="rows per chunk when streaming the meta export")
+    parser.add_argument("--backend", choices=["pandas", "duckdb"], default="pandas", help="engine for the summary statistics (duckdb queries the Parquet output)")
+    parser.add_argument("--no-checks", action="store_true", help="skip the integrity checks of the exports")
+    parser.add_argument("--diagnostics", action="store_true", help="log per-stage timing and memory as JSON lines on stderr")
+    args = parser.parse_args(argv)
+
+    if args.from_base == any([args.orders, args.meta, args.addresses]):
+        parser.error("pass the three exports, or --from-base without exports")
+    if args.from_base and args.backend == "duckdb":
+        parser.error("--from-base uses the pandas backend")
+    if args.from_base and args.items:
+        parser.error("--items needs the order exports the items are joined to")
+    if not args.from_base and not all([args.orders, args.meta, args.addresses]):
+        parser.error("pass all three exports")
+    if args.window and not args.from_base:
+        parser.error("--window applies to --from-base")
+
+    if args.diagnostics:
+        instrumentation.start_recording()
+    if args.backend == "duckdb" and not report_sql.available():
+        print("error: --backend duckdb needs the duckdb package (pip install duckdb)", file=sys.stderr)
+        return 1
+
+    if args.from_base:
+        if not base_stored():
+            print("error: no base dataset is stored yet; run an incremental update or database pull first", file=sys.stderr)
+            return 1
+        os.makedirs(args.out_dir, exist_ok=True)
+        now = pd.Timestamp.now()
+        windows = report_windows(now)
+        if args.window:
+            windows = {args.window: windows[args.window]}
+        windows = base_window_stats(windows)
+        summary = {
+            'generated_at': now.isoformat(),
+            'windows': windows
+        }
+        with open(os.path.join(args.out_dir, f"{args.name}_summary.json"), "w") as f:
+            json.dump(summary, f, indent=2, default=json_default)
+        return 0
+
+    integrity = []
+    try:
+        if not args.no_checks:
+            integrity = findings_summary(check_exports(args.orders, args.meta, args.addresses, chunksize=args.chunksize)).to_dict('records')
+            for finding in integrity:
+                if finding['rows']:
+                    print(f"{finding['severity']}: {finding['check']} in {finding['table']}: {finding['rows']} rows", file=sys.stderr)
+            # Errors fail the build or double count orders, so no report is written
+            if any(f['severity'] == 'error' and f['rows'] for f in integrity):
+                return 1
+        merged_df, _ = load_report(args.orders, args.meta, args.addresses, chunksize=args.chunksize)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    base = os.path.join(args.out_dir, args.name)
+    if args.format in ("csv", "both"):
+        format_for_display(merged_df).to_csv(f"{base}.csv", index=False)
+    if args.format in ("parquet", "both") or args.backend == "duckdb":
+        merged_df.to_parquet(f"{base}.parquet", index=False)
+    if args.items:
+        try:
+            lines = load_line_items(merged_df, *args.items, chunksize=args.chunksize)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+        product_summary(lines).to_csv(f"{base}_products.csv", index=False)
+
+    now = pd.Timestamp.now()
+    if args.backend == "duckdb":
+        windows = report_sql.compute_stats(f"{base}.parquet", report_windows(now))
+    else:
+        windows = compute_stats(merged_df, report_windows(now))
+    summary = {
+        'generated_at': now.isoformat(),
+        'orders': len(merged_df),
+        'integrity': integrity,
+        'windows': windows
+    }
+    with open(f"{base}_summary.json", "w") as f:
+        json.dump(summary, f, indent=2, default=json_default)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
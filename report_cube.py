@@ -0,0 +1,68 @@
+import pandas as pd
+
+from instrumentation import stage
+from report_pipeline import cancelled_statuses, summary_dims
+
+# Grain of the rollup: one row per day and combination of these columns
+cube_dims = ['POS Store', 'POS Register', "Cashier Name", 'Order Status']
+cube_measures = ['Number_of_Orders', 'Total_Sales', 'Total_Profit', 'Cancellations']
+
+# Drill-down order: the breakdown shown once each level above it is picked
+drill_levels = ['store_summary', 'register_summary', 'cashier_summary']
+
+
+@stage
+def build_cube(df):
+    # Built once per dataset; range queries then sum cube rows instead of scanning orders
+    dims = [d for d in cube_dims if d in df.columns]
+    measures = pd.DataFrame({
+        'Number_of_Orders': 1,
+        'Total_Sales': df['Selling Price'].fillna(0),
+        'Total_Profit': df['Profit (OMR)'].fillna(0),
+        'Cancellations': df['Order Status'].isin(cancelled_statuses).astype('int64')
+    }, index=df.index)
+    keys = [df['Order Date'].dt.floor('D').rename('Day')] + [df[d] for d in dims]
+    cube = measures.groupby(keys, dropna=False, observed=True).sum().reset_index()
+    # Sorted by day so a date range is a contiguous slice; orders without a date sort last
+    return cube.sort_values('Day', kind='stable', na_position='last', ignore_index=True)
+
+
+def cube_slice(cube, start=None, end=None, filters=None):
+    # start and end are inclusive days; None leaves that side open
+    # Undated rows sit after the dated ones and only belong to the unbounded (all time) range
+    days = cube['Day'].iloc[:cube['Day'].notna().sum()]
+    lo = days.searchsorted(pd.Timestamp(start)) if start is not None else 0
+    if end is not None:
+        hi = days.searchsorted(pd.Timestamp(end) + pd.Timedelta(days=1))
+    else:
+        hi = len(cube) if start is None else len(days)
+    rows = cube.iloc[lo:hi]
+    for dim, value in (filters or {}).items():
+        if value is not None:
+            rows = rows[rows[dim] == value]
+    return rows
+
+
+def cube_summary(cube, start=None, end=None, filters=None):
+    # Same shape as one period of compute_stats, so the summary views can render either
+    rows = cube_slice(cube, start, end, filters)
+    totals = rows[cube_measures].sum()
+    stats = {
+        'orders': int(totals['Number_of_Orders']),
+        'sales': totals['Total_Sales'],
+        'profit': totals['Total_Profit'],
+        'cancellations': int(totals['Cancellations'])
+    }
+    for key, dim in summary_dims.items():
+        if dim not in rows.columns:
+            stats[key] = {}
+            continue
+        summary = rows.groupby(dim, observed=True)[cube_measures].sum()
+        stats[key] = summary[summary['Number_of_Orders'] > 0].to_dict('index')
+    return stats
+
+
+def previous_period(start, end):
+    # The equally long range that ends the day before start
+    length = pd.Timestamp(end) - pd.Timestamp(start) + pd.Timedelta(days=1)
+    return pd.Timestamp(start) - length, pd.Timestamp(start) - pd.Timedelta(days=1)
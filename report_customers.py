@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+from order_table import normalize_email, normalize_phone
+from report_pipeline import cancelled_statuses
+
+# Contact columns shown for a customer; the latest non-empty value of each is kept
+contact_columns = ['Customer FName', 'Customer LName', 'Customer Phone', 'Customer Email']
+
+# RFM segments as (name, recency score range, frequency score range); the first match wins.
+# Scores run from 1 to 5, and customers tied on a value share the lower score
+rfm_segments = [
+    ('Champions', (4, 5), (4, 5)),
+    ('Loyal', (3, 5), (3, 5)),
+    ('New', (4, 5), (1, 1)),
+    ('Promising', (3, 5), (1, 2)),
+    ('At Risk', (1, 2), (3, 5)),
+    ('Hibernating', (1, 2), (1, 2))
+]
+
+
+def text_column(df, col):
+    if col in df.columns:
+        return df[col].astype('string')
+    return pd.Series(pd.NA, index=df.index, dtype='string')
+
+
+def customer_keys(df):
+    # Phone first, then email, each normalized and hashed so the key never carries the contact details.
+    # Orders with neither are walk-ins that cannot be told apart and get no key
+    phone = normalize_phone(text_column(df, 'Customer Phone'))
+    phone = phone.where(phone.str.len() == 8)
+    email = normalize_email(text_column(df, 'Customer Email'))
+    email = email.where(email.str.contains('@', regex=False))
+    contact = ('phone:' + phone).fillna('email:' + email)
+    hashed = pd.Series(pd.util.hash_pandas_object(contact.fillna(''), index=False).to_numpy(), index=df.index, dtype='UInt64')
+    return hashed.mask(contact.isna())
+
+
+def score(values):
+    # Quintile score from the rank of each value; missing values rank last
+    pct = values.rank(method='min', na_option='bottom', pct=True).to_numpy()
+    return np.clip(np.ceil(pct * 5), 1, 5).astype('int8')
+
+
+class CustomerIndex:
+    # Built once per dataset version: orders get an integer customer code, and every metric is then a
+    # grouped computation over those codes. Cancelled and refunded orders do not count towards a customer
+    def __init__(self, df):
+        codes, self.keys = pd.factorize(customer_keys(df))
+        counted = (codes >= 0) & ~df['Order Status'].isin(cancelled_statuses).to_numpy()
+        self.orders = pd.DataFrame({
+            'customer': codes[counted],
+            'Order Date': df['Order Date'].to_numpy()[counted],
+            'POS Store': df['POS Store'].array[counted],
+            'Sales': df['Selling Price'].fillna(0).to_numpy()[counted],
+            'Profit': df['Profit (OMR)'].fillna(0).to_numpy()[counted]
+        })
+        self.anonymous_orders = int((codes < 0).sum())
+        self.last_date = df['Order Date'].max()
+
+        grouped = self.orders.groupby('customer', sort=True)
+        customers = grouped.agg(
+            Orders=('Sales', 'size'),
+            Sales=('Sales', 'sum'),
+            Profit=('Profit', 'sum'),
+            First_Order=('Order Date', 'min'),
+            Last_Order=('Order Date', 'max')
+        ).rename(columns={'First_Order': 'First Order', 'Last_Order': 'Last Order'})
+        # Contact details of the most recent order that has them
+        contacts = pd.DataFrame({col: text_column(df, col).array[counted] for col in contact_columns})
+        order = np.argsort(self.orders['Order Date'].to_numpy(), kind='stable')
+        latest = contacts.iloc[order].groupby(self.orders['customer'].to_numpy()[order]).last()
+        self.customers = latest.join(customers, how='right')
+        self.customers['Customer Key'] = self.keys[self.customers.index].astype('uint64')
+        self._by_store = None
+        self._rfm = None
+        # Called with the size of tables built after the index, so an owner can account for them
+        self.on_grow = None
+
+    @property
+    def size(self):
+        return len(self.customers)
+
+    @property
+    def nbytes(self):
+        frames = [self.orders, self.customers, self._by_store, self._rfm]
+        return sum(int(frame.memory_usage(deep=True).sum()) for frame in frames if frame is not None) + self.keys.nbytes
+
+    def grew(self, frame):
+        if self.on_grow is not None:
+            self.on_grow(int(frame.memory_usage(deep=True).sum()))
+
+    def by_store(self):
+        # (store, customer) totals, computed on first use
+        if self._by_store is None:
+            self._by_store = self.orders.groupby(['POS Store', 'customer'], observed=True).agg(
+                Orders=('Sales', 'size'),
+                Sales=('Sales', 'sum'),
+                Profit=('Profit', 'sum')
+            )
+            self.grew(self._by_store)
+        return self._by_store
+
+    def stores(self):
+        return list(self.by_store().index.get_level_values('POS Store').unique())
+
+    def store_totals(self, store=None):
+        if store is None:
+            return self.customers
+        return self.by_store().xs(store, level='POS Store')
+
+    def repeat_rate(self, store=None):
+        # Share of customers with more than one order, and share of orders placed by them
+        totals = self.store_totals(store)
+        if totals.empty:
+            return {'customers': 0, 'repeat_customers': 0, 'repeat_rate': 0.0, 'repeat_order_share': 0.0}
+        repeat = totals['Orders'] > 1
+        return {
+            'customers': len(totals),
+            'repeat_customers': int(repeat.sum()),
+            'repeat_rate': float(repeat.mean()),
+            'repeat_order_share': float(totals.loc[repeat, 'Orders'].sum() / totals['Orders'].sum())
+        }
+
+    def lifetime_value(self, store=None):
+        totals = self.store_totals(store)
+        return {
+            'mean_sales': float(totals['Sales'].mean()) if len(totals) else 0.0,
+            'median_sales': float(totals['Sales'].median()) if len(totals) else 0.0,
+            'mean_profit': float(totals['Profit'].mean()) if len(totals) else 0.0,
+            'mean_orders': float(totals['Orders'].mean()) if len(totals) else 0.0
+        }
+
+    def top_customers(self, store=None, n=10, by='Sales'):
+        top = self.store_totals(store).nlargest(n, by, keep='first')
+        return self.customers[contact_columns].reindex(top.index).join(top[['Orders', 'Sales', 'Profit']]).reset_index(drop=True)
+
+    def rfm(self):
+        # Recency is measured from the latest order in the dataset, so older exports score the same way
+        if self._rfm is None:
+            recency = (self.last_date - self.customers['Last Order']).dt.days
+            r = 6 - score(recency)
+            f = score(self.customers['Orders'])
+            m = score(self.customers['Sales'])
+            conditions = [
+                (r >= r_lo) & (r <= r_hi) & (f >= f_lo) & (f <= f_hi)
+                for _, (r_lo, r_hi), (f_lo, f_hi) in rfm_segments
+            ]
+            self._rfm = pd.DataFrame({
+                'Recency (days)': recency.to_numpy(),
+                'R': r,
+                'F': f,
+                'M': m,
+                'Segment': pd.Categorical(
+                    np.select(conditions, [name for name, _, _ in rfm_segments], default='Other'),
+                    categories=[name for name, _, _ in rfm_segments] + ['Other']
+                )
+            }, index=self.customers.index)
+            self.grew(self._rfm)
+        return self._rfm
+
+    def segment_summary(self):
+        rfm = self.rfm().join(self.customers[['Orders', 'Sales', 'Profit']])
+        summary = rfm.groupby('Segment', observed=True).agg(
+            Customers=('Orders', 'size'),
+            Orders=('Orders', 'sum'),
+            Sales=('Sales', 'sum'),
+            Profit=('Profit', 'sum'),
+            Avg_Recency=('Recency (days)', 'mean')
+        ).rename(columns={'Avg_Recency': 'Avg Recency (days)'})
+        summary['Avg Sales'] = summary['Sales'] / summary['Customers']
+        return summary.reset_index()
+
+    def cohorts(self):
+        # Customers grouped by the month of their first order, with their value to date
+        first_month = self.customers['First Order'].dt.to_period('M')
+        grouped = self.customers.groupby(first_month)
+        cohorts = grouped.agg(
+            Customers=('Orders', 'size'),
+            Avg_Orders=('Orders', 'mean'),
+            Avg_Sales=('Sales', 'mean'),
+            Avg_Profit=('Profit', 'mean')
+        ).rename(columns=lambda c: c.replace('_', ' '))
+        cohorts['Repeat Rate'] = (self.customers['Orders'] > 1).groupby(first_month).mean()
+        cohorts.index = cohorts.index.to_timestamp()
+        cohorts.index.name = 'First Order Month'
+        return cohorts
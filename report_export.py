@@ -0,0 +1,94 @@
+import gzip
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from report_pipeline import format_for_display
+
+# File extension -> MIME type of every export format
+export_formats = {
+    'csv.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+# Rows serialized at a time, so only one chunk is ever copied or formatted in memory
+export_chunk_rows = 100_000
+
+# Excel worksheets stop at 1,048,576 rows, one of which is the header
+xlsx_max_rows = 1_048_575
+
+
+def export_rows(df, date_range=None, stores=None):
+    # Positions of the rows to export; the frame itself is never filtered into a copy
+    mask = np.ones(len(df), dtype=bool)
+    if date_range:
+        start = pd.Timestamp(date_range[0])
+        end = pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
+        mask &= ((df['Order Date'] >= start) & (df['Order Date'] < end)).to_numpy()
+    if stores:
+        mask &= df['POS Store'].isin(stores).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def chunks(df, rows, chunk_rows=export_chunk_rows):
+    for start in range(0, len(rows), chunk_rows):
+        yield df.iloc[rows[start:start + chunk_rows]]
+
+
+def write_csv_gz(df, rows, path):
+    # Formatted like the on-screen table, one chunk at a time
+    with gzip.open(path, 'wt', newline='') as f:
+        for i, chunk in enumerate(chunks(df, rows)):
+            format_for_display(chunk).to_csv(f, header=i == 0, index=False)
+
+
+def write_parquet(df, rows, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Typed columns; every chunk is written as its own row group against the schema of the full frame
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks(df, rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_xlsx(df, rows, path):
+    from openpyxl import Workbook
+
+    if len(rows) > xlsx_max_rows:
+        raise ValueError(f"{len(rows)} orders do not fit in one Excel sheet ({xlsx_max_rows} rows at most); narrow the filters or pick CSV or Parquet.")
+    # Write-only workbooks stream rows to disk instead of keeping every cell in memory
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Orders")
+    ws.append(list(df.columns))
+    for chunk in chunks(df, rows):
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(row)
+    wb.save(path)
+
+
+writers = {
+    'csv.gz': write_csv_gz,
+    'parquet': write_parquet,
+    'xlsx': write_xlsx
+}
+
+
+@stage
+def write_export(df, fmt, date_range=None, stores=None, directory=None):
+    # Returns the path of a temporary file the caller serves and then removes
+    rows = export_rows(df, date_range, stores)
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}", prefix="report_export_", dir=directory)
+    os.close(fd)
+    try:
+        writers[fmt](df, rows, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, len(rows)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from report_pipeline import apply_schema, check_columns, ingest_schema, read_dtypes, read_table, rewind
+
+# Item meta keys the product report consumes, all numeric; every other key in wp_woocommerce_order_itemmeta
+# is skipped at read time. The COGS plugin stores the unit cost of each line in _alg_wc_cog_item_cost
+item_meta_keys = {
+    '_product_id': 'Product ID',
+    '_variation_id': 'Variation ID',
+    '_qty': 'Quantity',
+    '_line_total': 'Line Sales',
+    '_alg_wc_cog_item_cost': 'Unit Cost',
+    '_refunded_item_id': 'Refunded Item ID'
+}
+
+# Order columns copied onto every line for the store, register, cashier and window breakdowns
+line_order_columns = ['Order Date', 'Order Status', 'POS Store', 'POS Register', "Cashier Name"]
+
+# A product line is the product, its variation (0 when the product has none) and its name on the order
+product_keys = ['Product ID', 'Variation ID', 'Product']
+product_measures = ['Quantity', 'Sales', 'Cost', 'Profit', 'Refunded Quantity', 'Refunded Sales']
+refund_statuses = ['Order Refunded']
+
+# Breakdown label -> line column
+product_breakdowns = {
+    'store': 'POS Store',
+    'register': 'POS Register',
+    'cashier': "Cashier Name"
+}
+
+def items_key(files, report_version):
+    # Line items are joined to one report, so its version is part of the content key
+    h = hashlib.sha256(report_version.encode())
+    for file in files:
+        rewind(file)
+        for block in iter(lambda: file.read(1 << 20), b""):
+            h.update(block)
+        rewind(file)
+        h.update(b"\0")
+    h.update(json.dumps({'items': ingest_schema['items'], 'itemmeta': ingest_schema['itemmeta'], 'item_meta_keys': item_meta_keys}, sort_keys=True).encode())
+    return h.hexdigest()
+
+def dedupe_item_meta(df):
+    # Last write wins, as for order meta
+    return df.sort_values('meta_id', kind='stable').drop_duplicates(['order_item_id', 'meta_key'], keep='last')
+
+def compact_item_meta(df):
+    # Values are parsed to numbers and keys become codes, so a kept row costs 25 bytes
+    return pd.DataFrame({
+        'meta_id': df['meta_id'].to_numpy(),
+        'order_item_id': df['order_item_id'].to_numpy(),
+        'meta_key': pd.Categorical(df['meta_key'], categories=list(item_meta_keys)),
+        'meta_value': pd.to_numeric(df['meta_value'], errors='coerce').astype('float64').to_numpy()
+    })
+
+@stage
+def read_item_meta_rows(file, chunksize=250_000):
+    # The item meta export is several times larger than order meta, so it is streamed in chunks and
+    # only the allowlisted keys of each chunk are kept
+    check_columns(pd.read_csv(rewind(file), nrows=0).columns, 'itemmeta')
+    parts = []
+    reader = pd.read_csv(
+        rewind(file),
+        usecols=list(ingest_schema['itemmeta']),
+        dtype=read_dtypes('itemmeta'),
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        chunk = chunk[chunk['meta_key'].isin(list(item_meta_keys))]
+        if not chunk.empty:
+            parts.append(dedupe_item_meta(compact_item_meta(chunk)))
+    if not parts:
+        return compact_item_meta(pd.DataFrame({col: pd.Series(dtype=kind) for col, kind in read_dtypes('itemmeta').items()}))
+    return pd.concat(parts, ignore_index=True)
+
+def prepare_item_meta(df):
+    # Frames pulled from the database are still text; streamed CSV rows are already compact
+    if not isinstance(df['meta_key'].dtype, pd.CategoricalDtype):
+        df = apply_schema(df, 'itemmeta')
+        df = compact_item_meta(df[df['meta_key'].isin(list(item_meta_keys))])
+    return dedupe_item_meta(df)
+
+@stage
+def pivot_item_meta(df):
+    # One row per line item with a float column per key; duplicates straddling chunks are resolved here
+    df = prepare_item_meta(df)
+    df_pivot = df.pivot(index='order_item_id', columns='meta_key', values='meta_value')
+    df_pivot.columns = df_pivot.columns.astype(str)
+    # Every allowlisted key is present, even when the export has no rows for it
+    return df_pivot.reindex(columns=list(item_meta_keys)).rename(columns=item_meta_keys)
+
+@stage
+def build_line_items(report, df_items, df_item_meta):
+    items = apply_schema(df_items, 'items')
+    # Shipping, fee, tax and coupon rows are not products
+    items = items[items['order_item_type'] == 'line_item']
+    item_meta = pivot_item_meta(df_item_meta)
+
+    # Partial refunds are lines of a refund order with negative quantity and total, pointing at the line
+    # they refund. They are summed onto that line rather than kept as lines of their own
+    refunded_item = item_meta['Refunded Item ID'].reindex(items['order_item_id'].to_numpy()).fillna(0).to_numpy()
+    refund_rows = item_meta.reindex(items.loc[refunded_item > 0, 'order_item_id'].to_numpy())
+    refunds = refund_rows[['Quantity', 'Line Sales']].fillna(0).groupby(refund_rows['Refunded Item ID'].to_numpy().astype('int64')).sum()
+    items = items[refunded_item <= 0]
+
+    # Hash joins: each line looks up its order row and its meta row once, then columns are gathered by position.
+    # Lines of orders that are not in the report are dropped
+    order_pos = pd.Index(report['Order ID']).get_indexer(items['order_id'])
+    items = items[order_pos >= 0]
+    order_pos = order_pos[order_pos >= 0]
+    values = item_meta.reindex(items['order_item_id'].to_numpy()).fillna(0)
+
+    quantity = values['Quantity'].to_numpy()
+    sales = values['Line Sales'].to_numpy()
+    # Lines without a recorded unit cost count as zero cost
+    cost = values['Unit Cost'].to_numpy() * quantity
+    refunded = refunds.reindex(items['order_item_id'].to_numpy()).fillna(0)
+    lines = pd.DataFrame({
+        'Order ID': items['order_id'].to_numpy(),
+        'Item ID': items['order_item_id'].to_numpy(),
+        'Product ID': values['Product ID'].to_numpy().astype('int64'),
+        'Variation ID': values['Variation ID'].to_numpy().astype('int64'),
+        'Product': pd.Categorical(items['order_item_name'].fillna('')),
+        'Quantity': quantity,
+        'Sales': sales,
+        'Cost': cost,
+        'Profit': sales - cost,
+        'Partly Refunded Quantity': -refunded['Quantity'].to_numpy(),
+        'Partly Refunded Sales': -refunded['Line Sales'].to_numpy()
+    })
+    for col in line_order_columns:
+        if col in report.columns:
+            lines[col] = report[col].array.take(order_pos)
+    return lines
+
+def load_line_items(report, items, itemmeta, chunksize=250_000):
+    return build_line_items(report, read_table(items, 'items'), read_item_meta_rows(itemmeta, chunksize))
+
+@stage
+def product_summary(lines, start=None, end=None, by=None, filters=None):
+    # Products (optionally within each store, register or cashier) for orders from start up to end, best profit first
+    mask = np.ones(len(lines), dtype=bool)
+    if start is not None:
+        mask &= (lines['Order Date'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (lines['Order Date'] < pd.Timestamp(end)).to_numpy()
+    for dim, value in (filters or {}).items():
+        if value is not None:
+            mask &= (lines[dim] == value).to_numpy()
+    rows = lines[mask]
+
+    # Lines of refunded orders count as refunded in full, and other lines by their partial refunds, so an
+    # order refunded in parts and then in full is not counted twice
+    refunded = rows['Order Status'].isin(refund_statuses).to_numpy()
+    measures = pd.DataFrame({
+        'Quantity': rows['Quantity'],
+        'Sales': rows['Sales'],
+        'Cost': rows['Cost'],
+        'Profit': rows['Profit'],
+        'Refunded Quantity': np.where(refunded, rows['Quantity'], rows['Partly Refunded Quantity']),
+        'Refunded Sales': np.where(refunded, rows['Sales'], rows['Partly Refunded Sales'])
+    }, index=rows.index)
+    keys = ([rows[product_breakdowns[by]]] if by else []) + [rows[k] for k in product_keys]
+    summary = measures.groupby(keys, observed=True).sum()
+    summary['Margin (%)'] = np.divide(
+        summary['Profit'] * 100, summary['Sales'],
+        out=np.zeros(len(summary)), where=summary['Sales'].to_numpy() != 0
+    )
+    return summary.sort_values('Profit', ascending=False, kind='stable').reset_index()
@@ -0,0 +1,200 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from report_pipeline import table_names
+
+logger = logging.getLogger("report.jobs")
+
+# Builds run on a worker pool owned by the server process, so they outlive the browser session that started them
+build_workers = int(os.environ.get("REPORT_BUILD_WORKERS", "1"))
+# Finished jobs kept for the status list
+jobs_kept = 20
+
+# Folder watched for new exports, and how often it is checked
+watch_dir = os.environ.get("REPORT_WATCH_DIR")
+watch_seconds = float(os.environ.get("REPORT_WATCH_SECONDS", "10"))
+
+# Progress phases of a build and the pipeline stages that start each one
+build_phases = ['load', 'pivot', 'merge', 'map', 'aggregate']
+stage_phases = {
+    'read_table': 'load',
+    'read_meta_rows': 'load',
+    'pivot_meta': 'pivot',
+    'preprocess_orders': 'pivot',
+    'preprocess_address': 'pivot',
+    'merge_tables': 'merge',
+    'apply_mappings': 'map'
+}
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+class BuildJob:
+    def __init__(self, key, label, diagnostics=False):
+        self.key = key
+        self.label = label
+        self.diagnostics = diagnostics
+        self.state = 'queued'
+        self.phase = None
+        self.error = None
+        # Stage records of the build when diagnostics are on; they fill in while it runs
+        self.records = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    @property
+    def progress(self):
+        if self.state == 'done':
+            return 1.0
+        if self.phase is None:
+            return 0.0
+        return build_phases.index(self.phase) / len(build_phases)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        # Cancellation is cooperative: the build stops at the next stage boundary
+        if self._cancel.is_set():
+            raise BuildCancelled()
+
+    def enter(self, phase):
+        self.check()
+        # Branches run concurrently, so a late stage of one branch never moves progress back
+        if self.phase is None or build_phases.index(phase) > build_phases.index(self.phase):
+            self.phase = phase
+
+    def on_stage(self, name):
+        if name in stage_phases:
+            self.enter(stage_phases[name])
+        else:
+            self.check()
+
+    def status(self):
+        end = self.finished or time.time()
+        return {
+            'build': self.label,
+            'dataset': self.key[:12],
+            'state': self.state,
+            'phase': self.phase,
+            'progress': round(self.progress * 100),
+            'seconds': round(end - (self.started or end), 1)
+        }
+
+
+class BuildJobs:
+    # Report builds keyed by dataset content; sessions keep the key and poll the job
+    def __init__(self, workers=build_workers):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-build")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, label, build, diagnostics=False):
+        # A queued or running build of the same files is reused, so a second click or a refresh attaches to it
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.active:
+                return job
+            job = BuildJob(key, label, diagnostics)
+            self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            self._prune()
+        self._pool.submit(self._run, job, build)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def cancel(self, key):
+        job = self.get(key)
+        if job is not None:
+            job.cancel()
+
+    def recent(self):
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _run(self, job, build):
+        # Every build gets a fresh context: pool threads are reused, and neither the listener nor the
+        # recording may leak between jobs
+        contextvars.Context().run(self._execute, job, build)
+
+    def _execute(self, job, build):
+        job.state = 'running'
+        job.started = time.time()
+        try:
+            job.check()
+            if job.diagnostics:
+                job.records = instrumentation.start_recording()
+            instrumentation.listen(job.on_stage)
+            build(job)
+        except BuildCancelled:
+            job.state = 'cancelled'
+        except Exception as e:
+            logger.exception("Report build %s failed", job.key[:12])
+            job.state = 'failed'
+            job.error = str(e)
+        else:
+            job.state = 'done'
+        finally:
+            job.finished = time.time()
+
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if not job.active]
+        for key in finished[:max(len(finished) - jobs_kept, 0)]:
+            del self._jobs[key]
+
+
+def export_paths(directory):
+    return [os.path.join(directory, f"{table_names[table]}.csv") for table in ('orders', 'meta', 'addresses')]
+
+
+class ExportWatcher:
+    # Polls a folder for the three exports and calls on_exports with their paths when a new set has settled
+    def __init__(self, directory, on_exports, interval=watch_seconds):
+        self.directory = directory
+        self.on_exports = on_exports
+        self.interval = interval
+        self.last_submitted = None
+        self.last_error = None
+        self._pending = None
+        threading.Thread(target=self._loop, name="report-watch", daemon=True).start()
+
+    def signature(self):
+        paths = export_paths(self.directory)
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        return tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths)
+
+    def poll(self):
+        signature = self.signature()
+        # A set is only built once it looks the same on two checks in a row, so half-copied files are skipped
+        if signature is not None and signature == self._pending and signature != self.last_submitted:
+            self.last_submitted = signature
+            self.on_exports([path for path, _, _ in signature])
+        self._pending = signature
+
+    def _loop(self):
+        while True:
+            try:
+                self.poll()
+                self.last_error = None
+            except Exception as e:
+                logger.exception("Watching %s failed", self.directory)
+                self.last_error = str(e)
+            time.sleep(self.interval)
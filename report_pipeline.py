@@ -0,0 +1,487 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+try:
+    import pyarrow  # noqa: F401
+    # pyarrow's CSV reader parses blocks on several threads, and its strings are stored in one buffer
+    csv_engine = 'pyarrow'
+    text_dtype = 'string[pyarrow]'
+except ImportError:
+    csv_engine = 'c'
+    text_dtype = 'string'
+
+# Status, register, store and cashier labels substituted into the report
+status_map = {
+    "wc-completed": "Order Complete",
+    "wc-refunded": "Order Refunded",
+    "wc-cancelled": "Order Cancelled"
+}
+
+register_map = {
+    22: "Register #1",
+    165: "Register #1",
+    23: "Register #2",
+    166: "Register #2"
+}
+
+store_map = {
+    21: "Muscat Branch",
+    164: "Sohar Branch"
+}
+
+cashier_map = {
+    1: "Sameer Siddiqui",
+    2: "Mahmood Al Ajmi",
+    4: "Mohamed Hasir",
+    6: "Sohar Cashier #1",
+    11: "Almonther Alshibli",
+    12: "Mohamed Ajmal"
+}
+
+def label_codes(values, mapping, keep_unmapped=True):
+    # Labels are looked up once per distinct ID; rows only get an integer code into the sorted label table.
+    # Unmapped IDs keep their own value as the label, or become missing when keep_unmapped is off
+    ids = values.astype('category')
+    labels = [mapping.get(k, str(k) if keep_unmapped else None) for k in ids.cat.categories]
+    categories = pd.Index(sorted({l for l in labels if l is not None}), dtype=object)
+    # The trailing -1 is picked up by the -1 code of missing IDs
+    lookup = np.array([categories.get_loc(l) if l is not None else -1 for l in labels] + [-1])
+    return pd.Categorical.from_codes(lookup[ids.cat.codes.to_numpy()], categories=categories)
+
+# Rename columns as requested
+rename_map = {
+    'id': 'Order ID',
+    'status': 'Order Status',
+    'date_created_gmt': 'Order Date',
+    'payment_method_title': 'Payment Method',
+    'customer_note': 'Purchase Note',
+    '_alg_wc_cog_order_items_cost': 'Cost of Goods',
+    '_alg_wc_cog_order_price': 'Selling Price',
+    '_alg_wc_cog_order_profit': 'Profit (OMR)',
+    '_alg_wc_cog_order_profit_margin': 'Profit (%)',
+    '_yith_pos_cashier': "Cashier Name",
+    '_yith_pos_register': 'POS Register',
+    'first_name_billing': 'Customer FName',
+    'last_name_billing': 'Customer LName',
+    'email_billing': 'Customer Email',
+    '_yith_pos_store': 'POS Store',
+    'phone_billing': 'Customer Phone'
+}
+
+# Meta keys the report consumes; every other key in wp_wc_orders_meta is skipped at read time
+meta_keys = [k for k in rename_map if k.startswith('_')]
+
+# Columns the report reads from each exported table and the type each is parsed to; nothing else is
+# materialized. Dates use the MySQL DATETIME layout shared by phpMyAdmin exports and direct pulls
+ingest_schema = {
+    'orders': {
+        'id': 'int64',
+        'status': 'str',
+        'date_created_gmt': 'datetime',
+        'customer_note': 'str'
+    },
+    'meta': {
+        'id': 'int64',
+        'order_id': 'int64',
+        'meta_key': 'str',
+        'meta_value': 'str'
+    },
+    'addresses': {
+        'order_id': 'int64',
+        'address_type': 'str',
+        'first_name': 'str',
+        'last_name': 'str',
+        'email': 'str',
+        'phone': 'str'
+    },
+    'items': {
+        'order_item_id': 'int64',
+        'order_item_name': 'str',
+        'order_item_type': 'str',
+        'order_id': 'int64'
+    },
+    'itemmeta': {
+        'meta_id': 'int64',
+        'order_item_id': 'int64',
+        'meta_key': 'str',
+        'meta_value': 'str'
+    }
+}
+date_format = '%Y-%m-%d %H:%M:%S'
+# Exports re-saved from a spreadsheet drop the seconds or switch to day-first dates (28-02-2024 23:02).
+# Values the declared format rejects are reordered year-first with this pattern and parsed as ISO 8601
+dayfirst_dates = (r'^(\d{1,2})[-/](\d{1,2})[-/](\d{4})', r'\3-\2-\1')
+
+table_names = {
+    'orders': 'wp_wc_orders',
+    'meta': 'wp_wc_orders_meta',
+    'addresses': 'wp_wc_order_addresses',
+    'items': 'wp_woocommerce_order_items',
+    'itemmeta': 'wp_woocommerce_order_itemmeta'
+}
+
+def read_dtypes(table):
+    # Dates are read as text and parsed once with the declared format
+    return {col: ('str' if kind == 'datetime' else kind) for col, kind in ingest_schema[table].items()}
+
+def check_columns(columns, table):
+    missing_cols = [c for c in ingest_schema[table] if c not in columns]
+    if missing_cols:
+        raise ValueError(f"The following required columns are missing from {table_names[table]}: {missing_cols}")
+
+class DateFormatError(ValueError):
+    pass
+
+def parse_dates(values):
+    # The declared format parses the whole column in one pass; only the values it rejects take the fallback
+    dates = pd.to_datetime(values, format=date_format, errors='coerce')
+    failed = (dates.isna() & values.notna()).to_numpy()
+    if failed.any():
+        reordered = values[failed].astype('string').str.replace(*dayfirst_dates, regex=True)
+        # A column that failed entirely comes back in seconds; the report keeps microseconds either way
+        dates = dates.astype('datetime64[us]')
+        dates[failed] = pd.to_datetime(reordered, format='ISO8601', errors='coerce').to_numpy()
+    return dates
+
+def apply_schema(df, table):
+    # Projects and types a frame from any source (CSV export or database pull) to the declared schema
+    check_columns(df.columns, table)
+    df = df[list(ingest_schema[table])].copy()
+    for col, kind in ingest_schema[table].items():
+        if kind == 'datetime':
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                values = df[col]
+                df[col] = parse_dates(values)
+                # A few bad dates become NaT and are reported by the integrity checks; a column that mostly
+                # fails is a layout the report does not know, and would leave every dated window empty
+                failed = df[col].isna() & values.notna()
+                if failed.sum() * 2 > values.notna().sum():
+                    raise DateFormatError(
+                        f"{int(failed.sum())} of {int(values.notna().sum())} {col} values in {table_names[table]} are not in a known date layout, "
+                        f"for example {values[failed].iloc[0]!r}"
+                    )
+        elif df[col].dtype != kind:
+            df[col] = df[col].astype(kind)
+    return df
+
+# Output type of each pivoted meta key; keys not listed here stay as text
+meta_dtypes = {
+    '_alg_wc_cog_order_items_cost': 'float64',
+    '_alg_wc_cog_order_price': 'float64',
+    '_alg_wc_cog_order_profit': 'float64',
+    '_alg_wc_cog_order_profit_margin': 'float64',
+    '_yith_pos_cashier': 'Int64',
+    '_yith_pos_register': 'Int64',
+    '_yith_pos_store': 'Int64'
+}
+
+# Storage layout of the report frame: dimensions are categorical codes into small label tables and
+# free text is Arrow-backed. Money and percentage columns stay float64 so exports keep their decimals,
+# and numeric columns get one fixed type so exported schemas do not change with the data
+dimension_columns = ['Order Status', "Cashier Name", 'POS Register', 'POS Store']
+text_columns = ['Customer FName', 'Customer LName', 'Customer Email', 'Customer Phone', 'Purchase Note']
+numeric_dtypes = {
+    'Order ID': 'int64'
+}
+
+def mapping_config():
+    # Everything that changes the built report for the same input files
+    return {
+        'meta_dtypes': meta_dtypes,
+        'status_map': status_map,
+        'register_map': register_map,
+        'store_map': store_map,
+        'cashier_map': cashier_map,
+        'rename_map': rename_map,
+        'ingest_schema': ingest_schema,
+        'date_format': date_format,
+        'dayfirst_dates': dayfirst_dates,
+        'dimension_columns': dimension_columns,
+        'text_columns': text_columns,
+        'numeric_dtypes': numeric_dtypes
+    }
+
+def dedupe_meta(df):
+    # Last write wins: keep the row with the highest meta id for each (order_id, meta_key) pair
+    return df.sort_values('id', kind='stable').drop_duplicates(['order_id', 'meta_key'], keep='last')
+
+@stage
+def pivot_meta(df):
+    df = dedupe_meta(df)
+    # Numeric keys are converted in one pass on the long column and pivoted separately from text keys
+    numeric = df['meta_key'].isin([k for k, t in meta_dtypes.items() if t != 'object'])
+    df_num = df[numeric].assign(meta_value=pd.to_numeric(df.loc[numeric, 'meta_value'], errors='coerce'))
+    df_pivot = pd.concat([
+        df_num.pivot(index='order_id', columns='meta_key', values='meta_value'),
+        df[~numeric].pivot(index='order_id', columns='meta_key', values='meta_value')
+    ], axis=1)
+    df_pivot.columns.name = None
+    df_pivot.index.name = 'order_id'
+    # Every allowlisted key is present with its declared type, even when the export has no rows for it
+    df_pivot = df_pivot.reindex(columns=meta_keys)
+    # Integer keys are IDs; a fractional value cannot be cast, so it becomes missing instead of failing the build
+    for k in meta_keys:
+        if meta_dtypes.get(k) == 'Int64':
+            df_pivot[k] = df_pivot[k].where(df_pivot[k] % 1 == 0)
+    df_pivot = df_pivot.astype({k: meta_dtypes.get(k, 'object') for k in meta_keys})
+    return df_pivot.reset_index()
+
+@stage
+def read_meta_rows(file, chunksize=250_000):
+    # Stream the EAV export in chunks, keep only the allowlisted keys and compact each chunk
+    parts = []
+    reader = pd.read_csv(
+        file,
+        usecols=list(ingest_schema['meta']),
+        dtype=read_dtypes('meta'),
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        chunk = chunk[chunk['meta_key'].isin(meta_keys)]
+        if not chunk.empty:
+            parts.append(dedupe_meta(chunk))
+    if not parts:
+        return pd.DataFrame(columns=list(ingest_schema['meta']))
+    return pd.concat(parts, ignore_index=True)
+
+def load_meta_csv(file, chunksize=250_000):
+    # Duplicates can straddle a chunk boundary, so the pivot resolves them again across chunks
+    return pivot_meta(read_meta_rows(rewind(file), chunksize))
+
+def rewind(file):
+    # Uploaded files may already have been read for a preview or a content hash
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return file
+
+@stage
+def read_table(file, table):
+    # The header is checked first so a missing column is reported by name, then only declared columns are parsed
+    check_columns(pd.read_csv(rewind(file), nrows=0).columns, table)
+    return pd.read_csv(rewind(file), engine=csv_engine, usecols=list(ingest_schema[table]), dtype=read_dtypes(table))
+
+@stage
+def preprocess_orders(df):
+    return apply_schema(df, 'orders')
+
+@stage
+def preprocess_address(df):
+    df = apply_schema(df, 'addresses')
+    # Only the billing address is reported; pivot by address_type so each order keeps a single row
+    df = df[df['address_type'] == 'billing']
+    df_pivot = df.pivot(index='order_id', columns='address_type')
+    df_pivot.columns = ['_'.join(col).strip() for col in df_pivot.columns.values]
+    df_pivot = df_pivot.reset_index()
+    return df_pivot
+
+main_cols = list(ingest_schema['orders'])
+
+@stage
+def merge_tables(df_orders_main, df_meta_clean, df_address_clean):
+    merged_df = pd.merge(df_orders_main, df_meta_clean, left_on='id', right_on='order_id', how='left')
+    merged_df = pd.merge(merged_df, df_address_clean, left_on='id', right_on='order_id', how='left')
+
+    # Remove redundant ID columns
+    for col in ['order_id_x', 'order_id_y', 'order_id']:
+        if col in merged_df.columns and col != 'id':
+            merged_df.drop(col, axis=1, inplace=True)
+    return merged_df
+
+@stage
+def apply_mappings(merged_df):
+    # Replace status values
+    if 'status' in merged_df.columns:
+        merged_df['status'] = label_codes(merged_df['status'], status_map)
+
+    # Replace _yith_pos_register values
+    if '_yith_pos_register' in merged_df.columns:
+        merged_df['_yith_pos_register'] = label_codes(merged_df['_yith_pos_register'], register_map)
+
+    # Replace _yith_pos_store values
+    if '_yith_pos_store' in merged_df.columns:
+        merged_df['_yith_pos_store'] = label_codes(merged_df['_yith_pos_store'], store_map)
+
+    # Replace _yith_pos_cashier values with a default for unmapped IDs
+    if '_yith_pos_cashier' in merged_df.columns:
+        merged_df['_yith_pos_cashier'] = label_codes(merged_df['_yith_pos_cashier'], cashier_map, keep_unmapped=False)
+
+    # Rename columns as requested
+    merged_df.rename(columns=rename_map, inplace=True)
+
+    desired_order = [
+        'Order ID', 'Order Status', 'Order Date',
+        "Cashier Name", 'POS Register', 'POS Store',
+        'Cost of Goods', 'Selling Price', 'Profit (OMR)', 'Profit (%)',
+        'Customer FName', 'Customer LName', 'Customer Email',
+        'Customer Phone', 'Purchase Note'
+    ]
+    final_columns = [col for col in desired_order if col in merged_df.columns]
+    return compact_report(merged_df[final_columns].copy())
+
+@stage
+def compact_report(df):
+    for col in dimension_columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in text_columns:
+        if col not in df.columns:
+            continue
+        values = df[col]
+        # Phone numbers read as floats when some are missing would otherwise gain a trailing .0
+        if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+            values = values.astype('Int64')
+        df[col] = values.astype(text_dtype)
+    for col, dtype in numeric_dtypes.items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def build_report(df_orders, df_meta, df_address):
+    # Meta data is pivoted and typed by load_meta_csv at upload time
+    return assemble_report(preprocess_orders(df_orders), df_meta, preprocess_address(df_address))
+
+def assemble_report(df_orders_clean, df_meta_clean, df_address_clean):
+    df_orders_main = df_orders_clean[main_cols].copy()
+
+    merged_df = merge_tables(df_orders_main, df_meta_clean, df_address_clean)
+    merged_df = apply_mappings(merged_df)
+    return merged_df, df_orders_main
+
+def ingest(orders, meta, addresses, on_branch_done=None, chunksize=250_000):
+    # Each table is parsed and preprocessed on its own worker; the branches only meet at the merges.
+    # Each worker runs in a copy of the caller's context so stage diagnostics still record into the same run
+    branches = {
+        'orders': lambda: preprocess_orders(read_table(orders, 'orders')),
+        'meta': lambda: load_meta_csv(meta, chunksize),
+        'addresses': lambda: preprocess_address(read_table(addresses, 'addresses'))
+    }
+
+    def timed(branch):
+        started = time.perf_counter()
+        return branch(), time.perf_counter() - started
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(branches)) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, timed, branch): name for name, branch in branches.items()}
+        # Callbacks run on the calling thread, so a UI can report each branch as it finishes
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name], seconds = future.result()
+            if on_branch_done is not None:
+                on_branch_done(name, results[name], seconds)
+    return results
+
+def load_report(orders, meta, addresses, on_branch_done=None, chunksize=250_000):
+    tables = ingest(orders, meta, addresses, on_branch_done, chunksize)
+    return assemble_report(tables['orders'], tables['meta'], tables['addresses'])
+
+# Money and margin columns stay numeric in merged_df; these formats are applied only when rendering or exporting
+display_formats = {
+    'Cost of Goods': 'OMR {:.3f}',
+    'Selling Price': 'OMR {:.3f}',
+    'Profit (OMR)': 'OMR {:.3f}',
+    'Profit (%)': '{:.2f}%'
+}
+
+@stage
+def format_for_display(df):
+    df = df.copy()
+    for col, fmt in display_formats.items():
+        if col in df.columns:
+            df[col] = df[col].map(fmt.format, na_action='ignore')
+    return df
+
+@stage
+def upsert_orders(base, delta):
+    # Delta rows replace base rows with the same Order ID, so later status changes overwrite the old row
+    base = base[~base['Order ID'].isin(delta['Order ID'])]
+    merged = pd.concat([base, delta], ignore_index=True)
+    # Categoricals with different label sets concatenate to plain objects, so the layout is restored
+    return compact_report(merged.sort_values('Order ID', kind='stable', ignore_index=True))
+
+def report_windows(now=None):
+    # Start of each summary window; None means no lower bound
+    now = now if now is not None else pd.Timestamp.now()
+    return {
+        "Last 30 Days": now - pd.Timedelta(days=30),
+        "Last 6 Months": now - pd.DateOffset(months=6),
+        "Last 1 Year": now - pd.DateOffset(years=1),
+        "All Time": None
+    }
+
+# Statuses counted as cancellations in the summaries
+cancelled_statuses = ['Order Cancelled', 'Order Refunded']
+
+summary_dims = {
+    'store_summary': 'POS Store',
+    'register_summary': 'POS Register',
+    'cashier_summary': "Cashier Name"
+}
+
+@stage
+def compute_stats(df, windows):
+    # merged_df holds one row per order, so order counts are sums of the window masks
+    cancelled = df['Order Status'].isin(cancelled_statuses)
+    sales = df['Selling Price'].fillna(0)
+    profit = df['Profit (OMR)'].fillna(0)
+
+    # One measure column per (window, metric); rows outside a window contribute zero
+    measures = {}
+    for period, start in windows.items():
+        in_window = df['Order Date'] >= start if start is not None else pd.Series(True, index=df.index)
+        measures[(period, 'Number_of_Orders')] = in_window.astype('int64')
+        measures[(period, 'Total_Sales')] = sales.where(in_window, 0.0)
+        measures[(period, 'Total_Profit')] = profit.where(in_window, 0.0)
+        measures[(period, 'Cancellations')] = (cancelled & in_window).astype('int64')
+    measures = pd.DataFrame(measures, index=df.index)
+    totals = measures.sum()
+
+    # Group once on every breakdown dimension, then roll the small result up per dimension
+    dims = [d for d in summary_dims.values() if d in df.columns]
+    grouped = measures.groupby([df[d] for d in dims], dropna=False, observed=True).sum() if dims else None
+
+    results = {}
+    for period in windows:
+        stats = {
+            'orders': int(totals[(period, 'Number_of_Orders')]),
+            'sales': totals[(period, 'Total_Sales')],
+            'profit': totals[(period, 'Total_Profit')],
+            'cancellations': int(totals[(period, 'Cancellations')])
+        }
+        for key, dim in summary_dims.items():
+            if dim not in dims:
+                stats[key] = {}
+                continue
+            summary = grouped[period].groupby(level=dim, observed=True).sum()
+            stats[key] = summary[summary['Number_of_Orders'] > 0].to_dict('index')
+        results[period] = stats
+    return results
+
+@stage
+def status_counts(df):
+    counts = df['Order Status'].value_counts()
+    return counts[counts > 0]
+
+@stage
+def cashier_performance(df):
+    return df.groupby("Cashier Name", observed=True)['Profit (OMR)'].sum().sort_values(ascending=False)
+
+@stage
+def monthly_sales(df):
+    monthly = (
+        df.groupby(df['Order Date'].dt.to_period('M'))['Selling Price'].sum()
+        .rename("Total Sales")
+        .reset_index()
+    )
+    monthly['Order Date'] = monthly['Order Date'].dt.to_timestamp()
+    return monthly.set_index('Order Date')['Total Sales']
+
+@stage
+def store_performance(df):
+    return df.groupby('POS Store', observed=True)['Selling Price'].sum().sort_values(ascending=False)
@@ -0,0 +1,143 @@
+import importlib.util
+import os
+
+import pandas as pd
+
+from instrumentation import stage
+from report_pipeline import cancelled_statuses, summary_dims
+
+# Worker threads per query; DuckDB uses every core by default
+sql_threads = os.environ.get("REPORT_SQL_THREADS")
+
+
+def available():
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def connect():
+    import duckdb
+
+    conn = duckdb.connect()
+    if sql_threads:
+        conn.execute(f"SET threads = {int(sql_threads)}")
+    return conn
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def query(path, sql, params=()):
+    # The Parquet file is scanned in place, so the dataset never has to fit in memory
+    conn = connect()
+    try:
+        conn.execute(f"CREATE VIEW orders AS SELECT * FROM read_parquet({quote_literal(path)})")
+        return conn.execute(sql, list(params)).df()
+    finally:
+        conn.close()
+
+
+@stage
+def compute_stats(path, windows):
+    # One scan: GROUPING SETS give the totals and the store, register and cashier rollups together,
+    # with a conditional sum per (window, metric) as in the pandas version
+    cancelled = f"{quote('Order Status')} IN ({', '.join(quote_literal(s) for s in cancelled_statuses)})"
+    columns = []
+    params = []
+    for i, (period, start) in enumerate(windows.items()):
+        if start is None:
+            in_window = "TRUE"
+        else:
+            in_window = f"{quote('Order Date')} >= ?"
+            params.extend([pd.Timestamp(start).to_pydatetime()] * 4)
+        columns += [
+            f"SUM(CASE WHEN {in_window} THEN 1 ELSE 0 END) AS w{i}_orders",
+            f"SUM(CASE WHEN {in_window} THEN COALESCE({quote('Selling Price')}, 0) ELSE 0 END) AS w{i}_sales",
+            f"SUM(CASE WHEN {in_window} THEN COALESCE({quote('Profit (OMR)')}, 0) ELSE 0 END) AS w{i}_profit",
+            f"SUM(CASE WHEN {in_window} AND {cancelled} THEN 1 ELSE 0 END) AS w{i}_cancellations"
+        ]
+    dims = list(summary_dims.values())
+    sets = ", ".join(["()"] + [f"({quote(d)})" for d in dims])
+    flags = ", ".join(f"GROUPING({quote(d)}) AS g{j}" for j, d in enumerate(dims))
+    sql = (
+        f"SELECT {', '.join(quote(d) for d in dims)}, {flags}, {', '.join(columns)} "
+        f"FROM orders GROUP BY GROUPING SETS ({sets})"
+    )
+    df = query(path, sql, params)
+
+    # GROUPING(dim) is 0 on the rows grouped by that dimension; every dimension is rolled up on the totals row
+    grand = df[df[[f"g{j}" for j in range(len(dims))]].eq(1).all(axis=1)].iloc[0]
+    results = {}
+    for i, period in enumerate(windows):
+        stats = {
+            'orders': int(grand[f"w{i}_orders"]),
+            'sales': float(grand[f"w{i}_sales"]),
+            'profit': float(grand[f"w{i}_profit"]),
+            'cancellations': int(grand[f"w{i}_cancellations"])
+        }
+        for j, (key, dim) in enumerate(summary_dims.items()):
+            # Missing labels are left out, as pandas drops them when rolling up
+            rows = df[(df[f"g{j}"] == 0) & df[dim].notna() & (df[f"w{i}_orders"] > 0)].sort_values(dim)
+            stats[key] = {
+                row[dim]: {
+                    'Number_of_Orders': int(row[f"w{i}_orders"]),
+                    'Total_Sales': float(row[f"w{i}_sales"]),
+                    'Total_Profit': float(row[f"w{i}_profit"]),
+                    'Cancellations': int(row[f"w{i}_cancellations"])
+                }
+                for _, row in rows.iterrows()
+            }
+        results[period] = stats
+    return results
+
+
+@stage
+def status_counts(path):
+    df = query(path, f"""
+        SELECT {quote('Order Status')}, COUNT(*) AS count FROM orders
+        WHERE {quote('Order Status')} IS NOT NULL GROUP BY 1 ORDER BY count DESC, 1
+    """)
+    return df.set_index('Order Status')['count']
+
+
+@stage
+def cashier_performance(path):
+    df = query(path, f"""
+        SELECT {quote('Cashier Name')}, COALESCE(SUM({quote('Profit (OMR)')}), 0) AS total FROM orders
+        WHERE {quote('Cashier Name')} IS NOT NULL GROUP BY 1 ORDER BY total DESC, 1
+    """)
+    return df.set_index('Cashier Name')['total'].rename('Profit (OMR)')
+
+
+@stage
+def monthly_sales(path):
+    df = query(path, f"""
+        SELECT date_trunc('month', {quote('Order Date')}) AS {quote('Order Date')},
+               COALESCE(SUM({quote('Selling Price')}), 0) AS {quote('Total Sales')}
+        FROM orders WHERE {quote('Order Date')} IS NOT NULL GROUP BY 1 ORDER BY 1
+    """)
+    return df.set_index('Order Date')['Total Sales']
+
+
+@stage
+def store_performance(path):
+    df = query(path, f"""
+        SELECT {quote('POS Store')}, COALESCE(SUM({quote('Selling Price')}), 0) AS total FROM orders
+        WHERE {quote('POS Store')} IS NOT NULL GROUP BY 1 ORDER BY total DESC, 1
+    """)
+    return df.set_index('POS Store')['total'].rename('Selling Price')
+
+
+def report_aggregates(path, windows):
+    # Same keys as the pandas aggregates the app renders
+    return {
+        'time_periods': compute_stats(path, windows),
+        'status_counts': status_counts(path),
+        'cashier_performance': cashier_performance(path),
+        'monthly_sales': monthly_sales(path),
+        'store_performance': store_performance(path)
+    }
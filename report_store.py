@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from report_pipeline import compact_report, dimension_columns, mapping_config, text_dtype
+
+# On-disk cache of merged reports, keyed by the uploaded files and the mapping configuration
+cache_dir = os.environ.get("REPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".report_cache"))
+cache_max_bytes = int(os.environ.get("REPORT_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+def dataset_key(files):
+    h = hashlib.sha256()
+    for file in files:
+        file.seek(0)
+        for block in iter(lambda: file.read(1 << 20), b""):
+            h.update(block)
+        file.seek(0)
+        h.update(b"\0")
+    h.update(json.dumps(mapping_config(), sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def frame_key(df):
+    # Content hash of a report built in memory (incremental updates, database pulls)
+    h = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update(json.dumps(list(df.columns)).encode())
+    return h.hexdigest()
+
+def cached_dataset_path(key):
+    return os.path.join(cache_dir, f"{key}.parquet")
+
+def load_cached_dataset(key):
+    path = cached_dataset_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_parquet(path, memory_map=True)
+    except Exception:
+        return None
+    # Bump the modification time so eviction treats this entry as recently used
+    os.utime(path)
+    return df
+
+def store_cached_dataset(key, df):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cached_dataset_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    evict_cached_datasets(keep=path)
+
+def evict_cached_datasets(keep=None):
+    # Drop least recently used entries until the cache fits its size cap
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".parquet"):
+            path = os.path.join(cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= cache_max_bytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+
+# Base dataset that incremental updates are merged into, stored as one Parquet partition per order month
+base_dir = os.path.join(cache_dir, "base")
+base_dataset_dir = os.path.join(base_dir, "orders")
+base_manifest_path = os.path.join(base_dir, "manifest.json")
+# Single-file layout written by earlier versions; still read until the next full store
+legacy_base_path = os.path.join(base_dir, "base_dataset.parquet")
+
+# Partition of orders without a date; only unbounded reads include it
+undated_month = "undated"
+
+def order_months(df):
+    return df['Order Date'].dt.strftime('%Y-%m').fillna(undated_month)
+
+def partition_path(month):
+    return os.path.join(base_dataset_dir, f"month={month}", "part.parquet")
+
+def stored_months():
+    if not os.path.isdir(base_dataset_dir):
+        return []
+    return sorted(name.split("=", 1)[1] for name in os.listdir(base_dataset_dir) if name.startswith("month="))
+
+def base_stored():
+    return bool(stored_months()) or os.path.exists(legacy_base_path)
+
+def months_in_range(months, start=None, end=None):
+    # Partition pruning: months overlapping [start, end], with either side open when None
+    if start is None and end is None:
+        return list(months)
+    first = pd.Timestamp(start).strftime('%Y-%m') if start is not None else ""
+    last = pd.Timestamp(end).strftime('%Y-%m') if end is not None else "9999-12"
+    return [m for m in months if m != undated_month and first <= m <= last]
+
+def partition_frame(df):
+    # Every partition is written with the same column types, so the directory reads as one dataset:
+    # compact_report's fixed numeric and text types, with dimensions as text since each partition would
+    # otherwise carry its own label set
+    df = compact_report(df.copy())
+    return df.astype({col: text_dtype for col in dimension_columns if col in df.columns})
+
+def write_partition(month, df):
+    path = partition_path(month)
+    if df.empty:
+        if os.path.exists(path):
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    partition_frame(df).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+# Columns the manifest summary is computed from
+summary_columns = ['Order ID', 'Order Date']
+
+def base_summary(frames):
+    # Order count, last Order ID and latest order, kept in the manifest so the base can be described without loading it
+    ids = [f['Order ID'].max() for f in frames if len(f)]
+    dates = [f['Order Date'].max() for f in frames if f['Order Date'].notna().any()]
+    return {
+        'orders': int(sum(len(f) for f in frames)),
+        'last_order_id': int(max(ids)) if ids else None,
+        'latest_order': str(max(dates)) if dates else None
+    }
+
+def read_base_manifest():
+    if not os.path.exists(base_manifest_path):
+        return {}
+    with open(base_manifest_path) as f:
+        return json.load(f)
+
+def stored_base_version():
+    return read_base_manifest().get("version")
+
+def store_base_manifest(version, summary):
+    with open(base_manifest_path, "w") as f:
+        json.dump({"version": version, "months": stored_months(), "summary": summary}, f)
+
+def stored_base_summary():
+    # Bases stored before the manifest had a summary get one from their Order ID and Order Date columns, once
+    manifest = read_base_manifest()
+    if "summary" in manifest:
+        return manifest["summary"]
+    months = stored_months()
+    paths = [partition_path(m) for m in months] or ([legacy_base_path] if os.path.exists(legacy_base_path) else [])
+    if not paths:
+        return None
+    summary = base_summary([pd.read_parquet(path, columns=summary_columns) for path in paths])
+    if months:
+        store_base_manifest(manifest.get("version"), summary)
+    return summary
+
+def load_base_dataset(start=None, end=None):
+    # Reads only the month partitions overlapping the range; rows of those months outside it are kept.
+    # A single-file base has no partitions to prune and is read whole
+    months = stored_months()
+    if not months:
+        if os.path.exists(legacy_base_path):
+            return pd.read_parquet(legacy_base_path, memory_map=True)
+        return None
+    parts = [pd.read_parquet(partition_path(m), memory_map=True) for m in months_in_range(months, start, end)]
+    if not parts:
+        # Nothing in range: an empty frame with the stored columns
+        parts = [pd.read_parquet(partition_path(months[0])).iloc[:0]]
+    df = pd.concat(parts, ignore_index=True).sort_values('Order ID', kind='stable', ignore_index=True)
+    # Dimensions are stored as text and become categorical again here
+    return compact_report(df)
+
+def store_base_dataset(df, version=None):
+    os.makedirs(base_dir, exist_ok=True)
+    months = order_months(df)
+    for month, part in df.groupby(months, sort=True):
+        write_partition(month, part)
+    for month in set(stored_months()) - set(months):
+        write_partition(month, df.iloc[:0])
+    if os.path.exists(legacy_base_path):
+        os.remove(legacy_base_path)
+    store_base_manifest(version, base_summary([df[summary_columns]]))
+
+def upsert_base_dataset(delta, version=None):
+    # Rewrites only the months holding a changed order, before or after the change; returns those months
+    changed_ids = delta['Order ID']
+    delta_months = order_months(delta)
+    affected = set(delta_months)
+    # The summary columns of untouched months are read here anyway, so the new summary costs no extra reads
+    untouched = {}
+    for month in stored_months():
+        stored = pd.read_parquet(partition_path(month), columns=summary_columns)
+        if stored['Order ID'].isin(changed_ids).any():
+            affected.add(month)
+        else:
+            untouched[month] = stored
+    written = []
+    for month in sorted(affected):
+        parts = [delta[delta_months == month]]
+        if os.path.exists(partition_path(month)):
+            stored = pd.read_parquet(partition_path(month))
+            parts.insert(0, stored[~stored['Order ID'].isin(changed_ids)])
+        part = pd.concat(parts, ignore_index=True).sort_values('Order ID', kind='stable', ignore_index=True)
+        write_partition(month, part)
+        written.append(part[summary_columns])
+    untouched = [stored for month, stored in untouched.items() if month not in affected]
+    store_base_manifest(version, base_summary(untouched + written))
+    return sorted(affected)
+
+db_watermark_path = os.path.join(base_dir, "db_watermark.json")
+
+def load_db_watermark():
+    if not os.path.exists(db_watermark_path):
+        return None
+    with open(db_watermark_path) as f:
+        return json.load(f)
+
+def store_db_watermark(watermark):
+    os.makedirs(os.path.dirname(db_watermark_path), exist_ok=True)
+    with open(db_watermark_path, "w") as f:
+        json.dump(watermark, f)
@@ -0,0 +1,245 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Order counts for the named benchmark scales
+scales = {
+    '10k': 10_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000
+}
+
+# Store -> registers and cashiers, matching the label maps in report_pipeline; cashier 99 is deliberately unmapped
+stores = {
+    21: {'registers': [22, 23], 'cashiers': [1, 2, 4, 11, 12, 99]},
+    164: {'registers': [165, 166], 'cashiers': [6, 99]}
+}
+
+statuses = ['wc-completed', 'wc-refunded', 'wc-cancelled', 'wc-processing']
+status_weights = [0.88, 0.05, 0.05, 0.02]
+
+# Meta keys written for every order besides the COGS and YITH keys the report reads
+noise_meta_keys = [
+    '_edit_lock', '_billing_address_index', '_shipping_address_index', '_billing_vat',
+    '_yith_pos_order', '_yith_pos_change', '_yith_pos_gateway_yith_pos_cash_gateway',
+    '_alg_wc_cog_order_cost', '_alg_wc_cog_order_profit_percent'
+]
+
+# Catalogue of products sold at the registers; a few best sellers account for most lines
+product_count = 400
+product_ids = 1000 + np.arange(product_count)
+product_weights = 1 / np.arange(1, product_count + 1)
+product_weights /= product_weights.sum()
+
+# Item meta keys WooCommerce writes for every line besides the ones the product report reads
+noise_item_meta_keys = ['_tax_class', '_line_subtotal', '_line_subtotal_tax', '_line_tax', '_line_tax_data', '_reduced_stock']
+
+address_columns = [
+    'id', 'order_id', 'address_type', 'first_name', 'last_name', 'company', 'address_1', 'address_2',
+    'city', 'state', 'postcode', 'country', 'email', 'phone'
+]
+
+
+def order_batch(rng, ids, start, span_seconds):
+    n = len(ids)
+    created = start + pd.to_timedelta(rng.integers(0, span_seconds, n), unit='s')
+    updated = created + pd.to_timedelta(rng.integers(0, 3 * 86400, n), unit='s')
+    price = rng.gamma(2.0, 15.0, n).round(3)
+    cost = (price * rng.uniform(0.55, 0.9, n)).round(3)
+    store = rng.choice(list(stores), n, p=[0.6, 0.4])
+    register = np.empty(n, dtype=np.int64)
+    cashier = np.empty(n, dtype=np.int64)
+    for store_id, staff in stores.items():
+        mask = store == store_id
+        register[mask] = rng.choice(staff['registers'], mask.sum())
+        named = len(staff['cashiers']) - 1
+        cashier[mask] = rng.choice(staff['cashiers'], mask.sum(), p=[0.98 / named] * named + [0.02])
+    orders = pd.DataFrame({
+        'id': ids,
+        'status': rng.choice(statuses, n, p=status_weights),
+        'currency': 'OMR',
+        'type': 'shop_order',
+        'tax_amount': 0,
+        'total_amount': price,
+        'customer_id': 0,
+        'billing_email': '',
+        'date_created_gmt': created.strftime('%Y-%m-%d %H:%M:%S'),
+        'date_updated_gmt': updated.strftime('%Y-%m-%d %H:%M:%S'),
+        'parent_order_id': 0,
+        'payment_method': 'yith_pos_cash_gateway',
+        'payment_method_title': rng.choice(['Cash', 'Card'], n, p=[0.7, 0.3]),
+        'transaction_id': '',
+        'ip_address': '127.0.0.1',
+        'user_agent': 'YITH POS',
+        'customer_note': ''
+    })
+    values = {
+        '_alg_wc_cog_order_items_cost': cost,
+        '_alg_wc_cog_order_price': price,
+        '_alg_wc_cog_order_profit': (price - cost).round(3),
+        '_alg_wc_cog_order_profit_margin': (np.divide(price - cost, price, out=np.zeros(n), where=price > 0) * 100).round(2),
+        '_yith_pos_cashier': cashier,
+        '_yith_pos_register': register,
+        '_yith_pos_store': store
+    }
+    return orders, values
+
+
+def meta_batch(rng, ids, values, first_meta_id, duplicate_rate):
+    keys = list(values) + noise_meta_keys
+    n = len(ids)
+    value_matrix = np.empty((n, len(keys)), dtype=object)
+    for i, key in enumerate(values):
+        value_matrix[:, i] = values[key]
+    value_matrix[:, len(values):] = '1'
+    meta = pd.DataFrame({
+        'order_id': np.repeat(ids, len(keys)),
+        'meta_key': np.tile(keys, n),
+        'meta_value': value_matrix.ravel()
+    })
+    # Plugins leave repeated (order_id, meta_key) rows behind; the later row (higher id) is the current value
+    dup = meta[meta['meta_key'].isin(['_alg_wc_cog_order_profit', '_yith_pos_cashier'])].sample(frac=duplicate_rate, random_state=int(rng.integers(1 << 31)))
+    meta = pd.concat([meta, dup], ignore_index=True)
+    meta.insert(0, 'id', np.arange(first_meta_id, first_meta_id + len(meta)))
+    return meta
+
+
+def item_batch(rng, ids, values, first_item_id, first_meta_id):
+    # One to three product lines per order that add up to the order's price and cost
+    n = len(ids)
+    per_order = rng.integers(1, 4, n)
+    order = np.repeat(np.arange(n), per_order)
+    share = rng.uniform(0.2, 1.0, len(order))
+    share /= np.bincount(order, weights=share)[order]
+    qty = rng.integers(1, 3, len(order))
+    product = rng.choice(product_count, len(order), p=product_weights)
+    # Every fifth product comes in variations
+    variation = np.where(product % 5 == 0, 5000 + product * 10 + rng.integers(0, 3, len(order)), 0)
+    line_total = (values['_alg_wc_cog_order_price'][order] * share).round(3)
+    unit_cost = (values['_alg_wc_cog_order_items_cost'][order] * share / qty).round(3)
+
+    item_ids = np.arange(first_item_id, first_item_id + len(order))
+    items = pd.DataFrame({
+        'order_item_id': item_ids,
+        'order_item_name': np.char.add('Product ', product_ids[product].astype(str)),
+        'order_item_type': 'line_item',
+        'order_id': ids[order]
+    })
+    # A few orders carry a coupon row, which is not a product line
+    coupon = rng.random(n) < 0.05
+    coupons = pd.DataFrame({
+        'order_item_id': np.arange(item_ids[-1] + 1, item_ids[-1] + 1 + coupon.sum()),
+        'order_item_name': 'walkin5',
+        'order_item_type': 'coupon',
+        'order_id': ids[coupon]
+    })
+    items = pd.concat([items, coupons], ignore_index=True)
+
+    line_values = {
+        '_product_id': product_ids[product],
+        '_variation_id': variation,
+        '_qty': qty,
+        '_line_total': line_total,
+        '_alg_wc_cog_item_cost': unit_cost
+    }
+    keys = list(line_values) + noise_item_meta_keys
+    value_matrix = np.empty((len(order), len(keys)), dtype=object)
+    for i, key in enumerate(line_values):
+        value_matrix[:, i] = line_values[key]
+    value_matrix[:, len(line_values):] = '0'
+    itemmeta = pd.DataFrame({
+        'order_item_id': np.repeat(item_ids, len(keys)),
+        'meta_key': np.tile(keys, len(order)),
+        'meta_value': value_matrix.ravel()
+    })
+    itemmeta.insert(0, 'meta_id', np.arange(first_meta_id, first_meta_id + len(itemmeta)))
+    return items, itemmeta
+
+
+def address_batch(rng, ids, first_address_id, customers):
+    n = len(ids)
+    customer = rng.integers(0, customers, n)
+    billing = pd.DataFrame({
+        'order_id': ids,
+        'address_type': 'billing',
+        'first_name': 'Customer',
+        'last_name': customer.astype(str),
+        'company': '',
+        'address_1': '',
+        'address_2': '',
+        'city': 'Muscat',
+        'state': '',
+        'postcode': '',
+        'country': 'OM',
+        'email': np.char.add(np.char.add('customer', customer.astype(str)), '@example.com'),
+        'phone': np.char.add('+968 9', np.char.zfill((customer % 10_000_000).astype(str), 7))
+    })
+    shipping = billing.assign(address_type='shipping', email='', phone='')
+    addresses = pd.concat([billing, shipping], ignore_index=True)
+    addresses.insert(0, 'id', np.arange(first_address_id, first_address_id + len(addresses)))
+    return addresses[address_columns]
+
+
+def generate(n_orders, out_dir, batch_size=200_000, duplicate_rate=0.02, years=5, seed=0, items=True):
+    rng = np.random.default_rng(seed)
+    # Line items draw from their own stream so the three order tables do not depend on them
+    item_rng = np.random.default_rng(seed + 1)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {
+        'orders': os.path.join(out_dir, 'wp_wc_orders.csv'),
+        'meta': os.path.join(out_dir, 'wp_wc_orders_meta.csv'),
+        'addresses': os.path.join(out_dir, 'wp_wc_order_addresses.csv')
+    }
+    if items:
+        paths['items'] = os.path.join(out_dir, 'wp_woocommerce_order_items.csv')
+        paths['itemmeta'] = os.path.join(out_dir, 'wp_woocommerce_order_itemmeta.csv')
+    end = pd.Timestamp.now().floor('s')
+    start = end - pd.DateOffset(years=years)
+    span_seconds = int((end - start).total_seconds())
+    # Walk-in customers repeat, so the customer pool is smaller than the order count
+    customers = max(n_orders // 3, 1)
+
+    next_meta_id = 1
+    next_address_id = 1
+    next_item_id = 1
+    next_item_meta_id = 1
+    for first in range(0, n_orders, batch_size):
+        ids = np.arange(first + 1, min(first + batch_size, n_orders) + 1)
+        orders, values = order_batch(rng, ids, start, span_seconds)
+        meta = meta_batch(rng, ids, values, next_meta_id, duplicate_rate)
+        addresses = address_batch(rng, ids, next_address_id, customers)
+        next_meta_id += len(meta)
+        next_address_id += len(addresses)
+
+        mode = 'w' if first == 0 else 'a'
+        orders.to_csv(paths['orders'], mode=mode, header=first == 0, index=False)
+        meta.to_csv(paths['meta'], mode=mode, header=first == 0, index=False)
+        addresses.to_csv(paths['addresses'], mode=mode, header=first == 0, index=False)
+        if items:
+            order_items, itemmeta = item_batch(item_rng, ids, values, next_item_id, next_item_meta_id)
+            next_item_id += len(order_items)
+            next_item_meta_id += len(itemmeta)
+            order_items.to_csv(paths['items'], mode=mode, header=first == 0, index=False)
+            itemmeta.to_csv(paths['itemmeta'], mode=mode, header=first == 0, index=False)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic WooCommerce/YITH POS exports for benchmarking.")
+    parser.add_argument("--scale", choices=list(scales), default='10k', help="number of orders to generate")
+    parser.add_argument("--orders", type=int, help="exact number of orders; overrides --scale")
+    parser.add_argument("--out-dir", default="bench_data", help="directory for the CSV files")
+    parser.add_argument("--duplicate-rate", type=float, default=0.02, help="share of profit/cashier meta rows written twice")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-items", action="store_true", help="skip the order item and item meta tables")
+    args = parser.parse_args(argv)
+
+    n_orders = args.orders or scales[args.scale]
+    for path in generate(n_orders, args.out_dir, duplicate_rate=args.duplicate_rate, seed=args.seed, items=not args.no_items).values():
+        print(path)
+
+
+if __name__ == "__main__":
+    main()